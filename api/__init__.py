@@ -1,7 +1,8 @@
 import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from .config import Config, config
+from . import admission, cache, compress, engine, hashing, idempotency, metrics, serialize, writes
+from .config import config
 db = SQLAlchemy()
 
 def create_app(env=None):
@@ -18,13 +19,33 @@ def create_app(env=None):
        app.config.from_object(config[env])    
     
     db.init_app(app)
+    engine.init_app(app, db)
+    hashing.init_app(app)
+    cache.init_app(app)
+    idempotency.init_app(app)
+    metrics.init_app(app, db)
+    admission.init_app(app)
+    writes.init_app(app, db)
+    serialize.init_app(app)
+    compress.init_app(app)
     
     # blueprints
     from .user import user
     from .todo import todo
+    from .admin import admin
+    from .jobs import jobs
+    from .batch import batch
     
     app.register_blueprint(user)
     app.register_blueprint(todo)
+    app.register_blueprint(admin)
+    app.register_blueprint(jobs)
+    app.register_blueprint(batch)
+
+    # background jobs and the todo change feed, job handlers are registered by the jobs blueprint
+    from . import changes, worker
+    worker.init_app(app, db)
+    changes.init_app(app)
 
     create_database(app)
 
@@ -32,10 +53,21 @@ def create_app(env=None):
 
 def create_database(app):
     """
-    create a database if not already created
+    create a database if not already created and apply pending migrations
     :param app: application instance
     :return: None 
     """
+    from .migrations import HEAD, lock, stored_version, upgrade
+
+    engine = db.get_engine(app)
+    # a database at the latest version needs a single query on startup,
+    # tables are only created and checked while migrations are pending
+    if stored_version(engine) == HEAD:
+        return
 
-    if not os.path.exists(Config().SQLALCHEMY_DATABASE_URI):
-        db.create_all(app=app)
\ No newline at end of file
+    # workers starting together create the tables one after another
+    with engine.begin() as conn:
+        lock(conn)
+        db.Model.metadata.create_all(conn)
+    # bring databases created by older versions up to date
+    upgrade(engine)
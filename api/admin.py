@@ -0,0 +1,220 @@
+import csv
+import io
+import json
+import uuid
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .models import ToDo, User
+from .search import MAX_TODO_ID, MAX_USER_ID
+from .user import token_required
+from .versions import USERS, bump, todo_key
+
+admin = Blueprint("admin", __name__, url_prefix="/api")
+
+# exported columns of every table
+TABLES = {
+    "user": (User.__table__, ("id", "public_id", "name", "password", "admin")),
+    "todo": (ToDo.__table__, ("id", "item", "complete", "user_id")),
+}
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+@admin.route("/export/<table>", methods=["GET"])
+@token_required
+def export_table(current_user, table):
+    """
+    stream every row of a table as ndjson or csv
+    :param current_user: user currently logged in
+    :param table: str "user" or "todo"
+    :return: ndjson or csv
+    """
+    if not current_user.admin:
+        return jsonify({"message": "You don't have permission to perform that function!"})
+
+    fmt = request.args.get("format", "ndjson")
+    if table not in TABLES or fmt not in FORMATS:
+        return jsonify({"message": "Unknown table or format!"}), 400
+
+    engine = db.engine
+    chunk_size = current_app.config["EXPORT_CHUNK_SIZE"]
+    columns = TABLES[table][1]
+    statement = select(*[TABLES[table][0].c[column] for column in columns]).order_by(TABLES[table][0].c.id)
+
+    def generate():
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(statement)
+            if fmt == "csv":
+                yield csv_lines([columns])
+            while True:
+                rows = result.fetchmany(chunk_size)
+                if not rows:
+                    break
+                if fmt == "csv":
+                    yield csv_lines(rows)
+                else:
+                    yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+
+    return current_app.response_class(generate(), mimetype=FORMATS[fmt])
+
+
+@admin.route("/import/<table>", methods=["POST"])
+@token_required
+def import_table(current_user, table):
+    """
+    insert ndjson rows read from the request body in chunked transactions,
+    progress is streamed back as one ndjson line per committed chunk
+    :param current_user: user currently logged in
+    :param table: str "user" or "todo"
+    :return: ndjson
+    """
+    if not current_user.admin:
+        return jsonify({"message": "You don't have permission to perform that function!"})
+
+    if table not in TABLES:
+        return jsonify({"message": "Unknown table or format!"}), 400
+
+    chunk_size = current_app.config["IMPORT_CHUNK_SIZE"]
+    stream = request.stream
+
+    def generate():
+        rows, total, number = [], 0, 0
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(IMPORTERS[table](json.loads(line)))
+            except (ValueError, TypeError, KeyError):
+                yield progress(total, error=f"Invalid row on line {number}!")
+                return
+
+            if len(rows) == chunk_size:
+                try:
+                    total += insert_chunk(table, rows)
+                except IntegrityError:
+                    db.session.rollback()
+                    yield progress(total, error=f"Could not insert the rows up to line {number}!")
+                    return
+                rows = []
+                yield progress(total)
+
+        if rows:
+            try:
+                total += insert_chunk(table, rows)
+            except IntegrityError:
+                db.session.rollback()
+                yield progress(total, error=f"Could not insert the rows up to line {number}!")
+                return
+        yield progress(total, done=True)
+
+    return current_app.response_class(stream_with_context(generate()), mimetype=FORMATS["ndjson"])
+
+
+def csv_lines(rows):
+    """
+    format rows as csv
+    :param rows: iterable of tuples
+    :return: str
+    """
+    output = io.StringIO()
+    csv.writer(output).writerows(rows)
+    return output.getvalue()
+
+
+def progress(rows, done=False, error=None):
+    """
+    format a progress line of an import
+    :param rows: int number of rows committed so far
+    :return: str ndjson line
+    """
+    line = {"rows": rows, "done": done}
+    if error:
+        line["error"] = error
+    return json.dumps(line) + "\n"
+
+
+def valid_id(value, maximum, optional=False):
+    """
+    check an imported id, ids are packed into the rowid of the todo search index
+    :param value: parsed json
+    :param maximum: int largest accepted id
+    :param optional: bool, also accept None for an id assigned by the database
+    :return: bool
+    """
+    if value is None:
+        return optional
+    return isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= maximum
+
+
+def user_row(data):
+    """
+    validate an imported user, passwords are imported as stored hashes
+    :param data: dict parsed line
+    :return: dict row
+    """
+    if not isinstance(data["name"], str) or not isinstance(data["password"], str) or \
+            not valid_id(data.get("id"), MAX_USER_ID, optional=True):
+        raise TypeError()
+    return {"id": data.get("id"), "public_id": data.get("public_id") or str(uuid.uuid4()),
+            "name": data["name"], "password": data["password"], "admin": bool(data.get("admin", False))}
+
+
+def todo_row(data):
+    """
+    validate an imported todo
+    :param data: dict parsed line
+    :return: dict row
+    """
+    if not isinstance(data["item"], str) or not valid_id(data["user_id"], MAX_USER_ID) or \
+            not valid_id(data.get("id"), MAX_TODO_ID, optional=True):
+        raise TypeError()
+    return {"id": data.get("id"), "item": data["item"], "complete": bool(data.get("complete", False)),
+            "user_id": data["user_id"]}
+
+
+IMPORTERS = {"user": user_row, "todo": todo_row}
+
+
+def insert_chunk(table, rows):
+    """
+    insert rows in one transaction and mark the affected listings as changed
+    :param table: str "user" or "todo"
+    :param rows: list of dict rows
+    :return: int number of inserted rows
+    """
+    owners = insert_rows(table, rows)
+    db.session.commit()
+    invalidate_owners(owners)
+    return len(rows)
+
+
+def insert_rows(table, rows):
+    """
+    insert rows and bump the counters of the affected listings, the caller commits
+    :param table: str "user" or "todo"
+    :param rows: list of dict rows
+    :return: set of the ids of the users whose todos changed
+    """
+    db.session.execute(TABLES[table][0].insert(), rows)
+
+    if table == "user":
+        bump(USERS)
+        return set()
+
+    owners = {row["user_id"] for row in rows}
+    for user_id in owners:
+        bump(todo_key(user_id))
+    return owners
+
+
+def invalidate_owners(owners):
+    """
+    drop the cached todo reads of users after a committed import
+    :param owners: iterable of user ids
+    :return: None
+    """
+    cache = current_app.extensions["todo_cache"]
+    for user_id in owners:
+        cache.invalidate(todo_key(user_id))
@@ -0,0 +1,197 @@
+import math
+import time
+from collections import OrderedDict
+from threading import Lock
+from flask import current_app, jsonify, request
+from .metrics import Counter
+
+# endpoints used before a client has a token, rate limited per client ip
+ANONYMOUS = {"user.login", "user.sign_up", "user.refresh_token"}
+
+# endpoints hashing a password, limited apart so they can not take the threads of the cheap reads
+HASHING = {"user.login", "user.sign_up", "user.update_user"}
+
+# environ key of the concurrency slot held by a request, the requests of a batch
+# share the batch's g but not its environ
+SLOT = "api.admission_limit"
+
+
+class TokenBuckets(object):
+    """
+    a token bucket per key, two numbers each. Buckets are kept in least recently
+    used order, a bucket idle long enough to be full again is the same as a new one
+    and is dropped, so only keys active within the last burst / rate seconds use memory
+    """
+    def __init__(self, rate, burst, maxsize):
+        """
+        :param rate: tokens added per second
+        :param burst: int capacity of a bucket
+        :param maxsize: int maximum number of buckets kept
+        """
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.idle = burst / rate
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._buckets)
+
+    def take(self, key):
+        """
+        take a token from the bucket of a key
+        :param key: hashable key
+        :return: 0 if a token was taken, else seconds until the next token
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._buckets:
+                oldest = next(iter(self._buckets))
+                if now - self._buckets[oldest][1] < self.idle:
+                    break
+                del self._buckets[oldest]
+
+            bucket = self._buckets.get(key)
+            tokens = self.burst if bucket is None else min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            admitted = tokens >= 1
+            self._buckets[key] = [tokens - 1 if admitted else tokens, now]
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return 0 if admitted else (1 - tokens) / self.rate
+
+
+class ConcurrencyLimit(object):
+    """
+    number of requests of an endpoint class allowed to run at the same time
+    """
+    def __init__(self, limit):
+        """
+        :param limit: int
+        """
+        self.limit = limit
+        self.active = 0
+        self._lock = Lock()
+
+    def acquire(self):
+        """
+        :return: bool, False if the limit is reached
+        """
+        with self._lock:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        """
+        :return: None
+        """
+        with self._lock:
+            self.active -= 1
+
+
+def endpoint_class(endpoint, method):
+    """
+    :param endpoint: str endpoint of the request
+    :param method: str http method
+    :return: str "hash", "read" or "write"
+    """
+    if endpoint in HASHING:
+        return "hash"
+    return "read" if method in ("GET", "HEAD") else "write"
+
+
+def reject(status, message, retry_after):
+    """
+    answer a request without running it
+    :param status: int 429 or 503
+    :param retry_after: seconds the client should wait
+    :return: response
+    """
+    response = jsonify({"message": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def charge(public_id):
+    """
+    take a token of a user's bucket for a request the before request hook does not see,
+    like the requests of a batch
+    :param public_id: str public id of the user
+    :return: None if admitted, else the 429 response
+    """
+    admission = current_app.extensions.get("admission")
+    if admission is None:
+        return None
+    wait = admission["users"].take(("user", public_id))
+    if not wait:
+        return None
+    if admission["rejections"] is not None:
+        admission["rejections"].inc("rate")
+    return reject(429, "Too many requests, try again later!", wait)
+
+
+def init_app(app):
+    """
+    limit the request rate of every user and client ip and the number of running
+    requests of every endpoint class, rejected requests fail fast with Retry-After
+    :param app: application instance
+    :return: None
+    """
+    if not app.config["ADMISSION_ENABLED"]:
+        return
+
+    from .user import authenticate
+
+    size = app.config["RATE_LIMIT_KEYS"]
+    users = TokenBuckets(*app.config["RATE_LIMIT"], size)
+    clients = TokenBuckets(*app.config["LOGIN_RATE_LIMIT"], size)
+    limits = {name: ConcurrencyLimit(limit) for name, limit in app.config["CONCURRENCY_LIMITS"].items()}
+
+    rejections = None
+    metrics = app.extensions.get("metrics")
+    if metrics is not None:
+        rejections = metrics.register(Counter("admission_rejections_total",
+            "Requests rejected by the rate and concurrency limits", ("reason",)))
+    app.extensions["admission"] = {"users": users, "clients": clients, "limits": limits, "rejections": rejections}
+
+    def rate_key():
+        # a valid token is verified once here, token_required then finds it in the token cache
+        token = request.headers.get("x-access-token")
+        current_user = authenticate(token) if token else None
+        if current_user is not None:
+            return "user", current_user.public_id
+        return "ip", request.remote_addr
+
+    @app.before_request
+    def admit():
+        # only the api is limited, not /metrics or unknown urls
+        if request.blueprint is None:
+            return None
+
+        if request.endpoint in ANONYMOUS:
+            wait = clients.take(request.remote_addr)
+        else:
+            wait = users.take(rate_key())
+        if wait:
+            if rejections is not None:
+                rejections.inc("rate")
+            return reject(429, "Too many requests, try again later!", wait)
+
+        limit = limits[endpoint_class(request.endpoint, request.method)]
+        if not limit.acquire():
+            if rejections is not None:
+                rejections.inc("concurrency")
+            return reject(503, "Server is busy, try again later!", current_app.config["ADMISSION_RETRY_AFTER"])
+        request.environ[SLOT] = limit
+        return None
+
+    @app.teardown_request
+    def release(exception):
+        limit = request.environ.pop(SLOT, None)
+        if limit is not None:
+            limit.release()
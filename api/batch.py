@@ -0,0 +1,137 @@
+import json
+from flask import Blueprint, request, jsonify, current_app, g
+from sqlalchemy import text
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+from . import db
+from .admission import ANONYMOUS, HASHING, charge
+from .idempotency import hold_responses, release_responses
+from .serialize import json_response
+from .todo import invalidate
+from .user import token_required
+
+batch = Blueprint("batch", __name__, url_prefix="/api")
+
+# endpoints that stream their response or read the raw body can not run inside a batch, nor
+# the ones rate limited per client ip or hashing passwords, a batch would bypass their limits
+NOT_BATCHABLE = {"batch.run_batch", "todo.changes", "admin.export_table", "admin.import_table"} | ANONYMOUS | HASHING
+
+# response headers passed on to the client
+HEADERS = ("ETag", "Location", "Retry-After")
+
+
+@batch.route("/batch", methods=["POST"])
+@token_required
+def run_batch(current_user):
+    """
+    run several requests of the current user in one round trip, the token is
+    verified once for all of them. An atomic batch runs them in one transaction
+    that is rolled back when any of them fails, only todo endpoints are allowed there
+    :param current_user: user currently logged in
+    :return: json with one response per request
+    """
+    data = request.get_json(silent=True)
+    atomic = False
+    if isinstance(data, dict):
+        atomic = data.get("atomic") is True
+        data = data.get("requests")
+
+    if not isinstance(data, list) or not data or not all(valid(entry) for entry in data):
+        return jsonify({"message": "Expected a list of requests!"}), 400
+
+    if len(data) > current_app.config["BATCH_MAX"]:
+        return jsonify({"message": "Too many requests in one batch!"}), 413
+
+    if atomic:
+        # end the read transaction of the authentication, sqlite has to see the BEGIN
+        db.session.commit()
+        if db.get_engine().dialect.name == "sqlite":
+            # pysqlite does not begin a transaction for SAVEPOINT, the first
+            # release would commit on its own
+            db.session.execute(text("BEGIN IMMEDIATE"))
+
+    g.batch_user = current_user
+    if atomic:
+        # an idempotent request's response is only stored if the batch commits
+        hold_responses()
+    committed = False
+    try:
+        responses = []
+        for entry in data:
+            response = dispatch(entry, atomic)
+            responses.append(response)
+            if atomic and response["status"] >= 400:
+                break
+
+        if atomic:
+            if responses[-1]["status"] >= 400:
+                db.session.rollback()
+            else:
+                db.session.commit()
+                committed = True
+            # the requests dropped the cached reads before the batch committed
+            invalidate(current_user.id)
+    finally:
+        g.pop("batch_user", None)
+        if atomic:
+            release_responses(committed)
+
+    return json_response({"responses": responses, "committed": not atomic or responses[-1]["status"] < 400})
+
+
+def valid(entry):
+    """
+    check the shape of a request of a batch
+    :param entry: parsed json
+    :return: bool
+    """
+    return isinstance(entry, dict) and isinstance(entry.get("method"), str) and \
+        isinstance(entry.get("path"), str) and entry["path"].startswith("/api/") and \
+        isinstance(entry.get("headers", {}), dict)
+
+
+def dispatch(entry, atomic):
+    """
+    run a request of a batch through the view function its path matches,
+    without the before and after request hooks of the batch request
+    :param entry: dict with the method, path, optional json body and headers
+    :param atomic: bool, run it in a savepoint of the batch transaction
+    :return: dict with the status, headers and body of the response
+    """
+    app = current_app._get_current_object()
+    headers = {name: str(value) for name, value in entry.get("headers", {}).items()}
+    builder = EnvironBuilder(path=entry["path"], method=entry["method"].upper(), base_url=request.host_url,
+                             json=entry.get("body"), headers=headers)
+
+    with app.request_context(builder.get_environ()):
+        if request.url_rule is not None and request.url_rule.endpoint in NOT_BATCHABLE or \
+                atomic and request.blueprint != "todo":
+            return {"status": 400, "body": {"message": "Endpoint can not be batched!"}}
+
+        # every request of a batch counts against the rate limit of its user
+        response = charge(g.batch_user.public_id)
+        if response is None:
+            nested = db.session.begin_nested() if atomic else None
+            try:
+                try:
+                    response = app.make_response(app.dispatch_request())
+                except HTTPException as e:
+                    response = jsonify({"message": e.description})
+                    response.status_code = e.code
+                except Exception as e:
+                    response = app.make_response(app.handle_user_exception(e))
+                if nested is not None and nested.is_active:
+                    nested.commit()
+            except Exception:
+                app.logger.exception("Batch request %s %s failed", entry["method"], entry["path"])
+                if not atomic:
+                    db.session.rollback()
+                return {"status": 500, "body": {"message": "Internal server error!"}}
+
+        body = response.get_data(as_text=True)
+        result = {"status": response.status_code,
+                  "body": json.loads(body) if response.is_json and body else body}
+        passed = {name: response.headers[name] for name in HEADERS if name in response.headers}
+        if passed:
+            result["headers"] = passed
+        return result
@@ -0,0 +1,258 @@
+import json
+import time
+import uuid
+from collections import OrderedDict
+from threading import Lock
+
+
+class TTLCache(object):
+    """
+    thread-safe in-process cache evicting the least recently used entry
+    once full and dropping entries after their time to live
+    """
+    def __init__(self, maxsize, ttl=None):
+        """
+        :param maxsize: int maximum number of entries kept
+        :param ttl: default time to live of an entry in seconds, None for no expiry
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key, default=None):
+        """
+        get a live entry and mark it as recently used
+        :param key: hashable key
+        :param default: value returned on a miss
+        :return: stored value or default
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        store an entry, evicting the least recently used one if full
+        :param key: hashable key
+        :param value: value to store
+        :param ttl: time to live in seconds, defaults to the cache ttl
+        :return: None
+        """
+        if ttl is None:
+            ttl = self.ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        remove an entry
+        :param key: hashable key
+        :param default: value returned if the key is missing
+        :return: removed value or default
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def pop_where(self, predicate):
+        """
+        remove every entry matching a predicate
+        :param predicate: function taking (key, value) and returning bool
+        :return: int number of removed entries
+        """
+        with self._lock:
+            keys = [key for key, (value, _) in self._data.items() if predicate(key, value)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        """
+        remove all entries
+        :return: None
+        """
+        with self._lock:
+            self._data.clear()
+
+
+class MemoryBackend(object):
+    """
+    cache backend keeping the entries in the memory of this process
+    """
+    def __init__(self, maxsize):
+        """
+        :param maxsize: int maximum number of entries kept
+        """
+        self._cache = TTLCache(maxsize)
+        self._lock = Lock()
+
+    def get(self, key):
+        """
+        :return: stored value or None
+        """
+        return self._cache.get(key)
+
+    def set(self, key, value, ttl=None):
+        """
+        store a value, without expiry if ttl is None
+        """
+        self._cache.set(key, value, ttl)
+
+    def add(self, key, value):
+        """
+        store a value only if the key is missing
+        """
+        with self._lock:
+            if self._cache.get(key) is None:
+                self._cache.set(key, value)
+
+    def delete(self, key):
+        """
+        remove a value
+        """
+        self._cache.pop(key)
+
+
+class SharedBackend(object):
+    """
+    cache backend shared between processes through a redis compatible client,
+    values are stored as json
+    """
+    def __init__(self, client, prefix="api:"):
+        """
+        :param client: object with get, set(ex, nx) and delete like redis.Redis
+        :param prefix: str prepended to every key
+        """
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        """
+        :return: stored value or None
+        """
+        value = self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        """
+        store a value, without expiry if ttl is None
+        """
+        self.client.set(self.prefix + key, json.dumps(value), ex=None if ttl is None else max(1, int(ttl)))
+
+    def add(self, key, value):
+        """
+        store a value only if the key is missing
+        """
+        self.client.set(self.prefix + key, json.dumps(value), nx=True)
+
+    def delete(self, key):
+        """
+        remove a value
+        """
+        self.client.delete(self.prefix + key)
+
+
+class ReadCache(object):
+    """
+    read-through cache of json payloads grouped in namespaces, invalidating a
+    namespace switches it to a new generation so entries written by requests
+    that read the database before the change are never served
+    """
+    def __init__(self, backend, ttl):
+        """
+        :param backend: MemoryBackend or SharedBackend
+        :param ttl: time to live of an entry in seconds
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    def generation(self, namespace):
+        """
+        get the current generation of a namespace, starting a new one if unknown
+        :param namespace: str
+        :return: str generation
+        """
+        key = "gen:" + namespace
+        generation = self.backend.get(key)
+        if generation is None:
+            self.backend.add(key, uuid.uuid4().hex)
+            generation = self.backend.get(key)
+        return generation
+
+    def get_or_set(self, namespace, variant, load):
+        """
+        get a payload, loading and storing it on a miss
+        :param namespace: str group of entries invalidated together
+        :param variant: str identifying the payload inside the namespace
+        :param load: function without arguments returning the payload, None is not stored
+        :return: payload
+        """
+        key = "{}:{}:{}".format(namespace, self.generation(namespace), variant)
+        value = self.backend.get(key)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if value is None:
+            value = load()
+            if value is not None:
+                self.backend.set(key, value, self.ttl)
+        return value
+
+    def invalidate(self, namespace):
+        """
+        drop every entry of a namespace
+        :param namespace: str
+        :return: None
+        """
+        self.backend.set("gen:" + namespace, uuid.uuid4().hex)
+
+    def stats(self):
+        """
+        :return: dict with the hit and miss counters
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def init_app(app):
+    """
+    attach the token cache and the todo read cache to the app
+    :param app: application instance
+    :return: None
+    """
+    app.extensions["token_cache"] = TTLCache(app.config["TOKEN_CACHE_SIZE"], app.config["TOKEN_CACHE_TTL"])
+
+    url = app.config["TODO_CACHE_URL"]
+    if url:
+        # optional dependency, only needed for a shared cache
+        import redis
+        backend = SharedBackend(redis.Redis.from_url(url))
+    else:
+        backend = MemoryBackend(app.config["TODO_CACHE_SIZE"])
+    app.extensions["todo_cache"] = ReadCache(backend, app.config["TODO_CACHE_TTL"])
@@ -0,0 +1,310 @@
+import json
+import os
+import queue
+import time
+from datetime import datetime
+from threading import Event, Lock, Thread
+from sqlalchemy import func, select, update
+from . import db
+from .migrations import lock
+from .models import Change, Version
+
+# rows read by one query of the poller or of a resumed stream
+BATCH = 1000
+
+# milliseconds a disconnected client waits before it reconnects
+RETRY = 3000
+
+# key of the versions row holding the id of the newest pruned change
+PRUNED = "change_log:pruned"
+
+
+def record(user_id, op, data):
+    """
+    log a change of a user's todos in the current transaction
+    :param user_id: int id of the owner
+    :param op: str "create", "complete" or "delete"
+    :param data: json serializable dict describing the change
+    :return: None
+    """
+    db.session.execute(Change.__table__.insert().values(user_id=user_id, op=op, data=json.dumps(data),
+                                                        created=datetime.utcnow()))
+
+
+def event(change_id, op, data):
+    """
+    format a server-sent event
+    :param change_id: int
+    :param op: str
+    :param data: str json
+    :return: str
+    """
+    return f"id: {change_id}\nevent: {op}\ndata: {data}\n\n"
+
+
+class Subscriber(object):
+    """
+    a connected stream, the poller puts the changes of its user in the queue
+    """
+    def __init__(self, user_id, size):
+        self.user_id = user_id
+        self.queue = queue.Queue(size)
+        # set when the stream fell too far behind, the client resumes with Last-Event-ID
+        self.closed = False
+
+
+class ChangeFeed(object):
+    """
+    fan the change log out to every stream of this process from a single poller
+    thread, a stream holds no database connection while it waits
+    """
+    def __init__(self, app, poll, keepalive, queue_size, retention, prune_interval):
+        """
+        :param app: application instance
+        :param poll: seconds between two reads of the change log, 0 to only read through poll()
+        :param keepalive: seconds of silence before a comment keeps the connection open
+        :param queue_size: int changes buffered per stream
+        :param retention: timedelta changes are kept for
+        :param prune_interval: seconds between two prunes of the change log by the poller
+        """
+        self.app = app
+        self.poll_interval = poll
+        self.keepalive = keepalive
+        self.queue_size = queue_size
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self._next_prune = 0
+        self._subscribers = {}
+        self._last = 0
+        self._lock = Lock()
+        self._wake = Event()
+        self._pid = None
+
+    def engine(self):
+        """
+        :return: sqlalchemy engine of the app
+        """
+        return db.get_engine(self.app)
+
+    def subscribe(self, user_id):
+        """
+        register a stream for the changes of a user
+        :param user_id: int
+        :return: Subscriber
+        """
+        subscriber = Subscriber(user_id, self.queue_size)
+        with self._lock:
+            if not self._subscribers:
+                # the poller skips the log while nobody listens
+                self._last = self.latest()
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        self.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """
+        :param subscriber: Subscriber
+        :return: None
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.user_id, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self._subscribers.pop(subscriber.user_id, None)
+
+    def latest(self):
+        """
+        :return: int id of the newest change, 0 if none
+        """
+        with self.engine().connect() as conn:
+            return conn.execute(select(func.max(Change.id))).scalar() or 0
+
+    def notify(self):
+        """
+        wake the poller after this process committed a change
+        :return: None
+        """
+        self._wake.set()
+
+    def start(self):
+        """
+        start the poller thread of this process if not running yet
+        :return: None
+        """
+        if self._pid == os.getpid() or not self.poll_interval:
+            return
+        with self._lock:
+            # threads do not survive a fork, every worker process polls for itself
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                Thread(target=self.run, name="change-feed", daemon=True).start()
+
+    def run(self):
+        """
+        loop of the poller thread
+        :return: None
+        """
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.poll()
+            except Exception:
+                self.app.logger.exception("Change feed poll failed")
+
+            if time.monotonic() >= self._next_prune:
+                self._next_prune = time.monotonic() + self.prune_interval
+                try:
+                    self.prune()
+                except Exception:
+                    self.app.logger.exception("Change log prune failed")
+
+    def poll(self):
+        """
+        read the changes committed since the last poll and hand them to the streams of their users.
+        Change ids are handed out in commit order by the single sqlite writer, so no
+        change can appear below the last id read
+        :return: int number of changes read
+        """
+        if not self._subscribers:
+            return 0
+
+        count = 0
+        with self.engine().connect() as conn:
+            while True:
+                rows = conn.execute(select(Change.id, Change.user_id, Change.op, Change.data)
+                                    .where(Change.id > self._last).order_by(Change.id).limit(BATCH)).all()
+                with self._lock:
+                    for change_id, user_id, op, data in rows:
+                        for subscriber in list(self._subscribers.get(user_id, ())):
+                            try:
+                                subscriber.queue.put_nowait((change_id, op, data))
+                            except queue.Full:
+                                subscriber.closed = True
+                                self._subscribers[user_id].discard(subscriber)
+                        self._last = change_id
+                count += len(rows)
+                if len(rows) < BATCH:
+                    return count
+
+    def prune(self):
+        """
+        delete the changes older than the retention, oldest first in one short
+        transaction per batch. Ids grow with time, so the walk stops at the first
+        change to keep and the id of the newest deleted change is stored as the watermark
+        :return: int number of deleted changes
+        """
+        cutoff = datetime.utcnow() - self.retention
+        count = 0
+        while True:
+            with self.engine().begin() as conn:
+                lock(conn)
+                expired = []
+                for change_id, created in conn.execute(select(Change.id, Change.created)
+                                                       .order_by(Change.id).limit(BATCH)):
+                    if created is not None and created >= cutoff:
+                        break
+                    expired.append(change_id)
+                if not expired:
+                    return count
+
+                conn.execute(Change.__table__.delete().where(Change.id <= expired[-1]))
+                moved = conn.execute(update(Version).where(Version.key == PRUNED)
+                                     .values(value=func.max(Version.value, expired[-1])))
+                if not moved.rowcount:
+                    conn.execute(Version.__table__.insert().values(key=PRUNED, value=expired[-1]))
+            count += len(expired)
+            if len(expired) < BATCH:
+                return count
+
+    def pruned(self):
+        """
+        :return: int id of the newest pruned change, 0 if none
+        """
+        with self.engine().connect() as conn:
+            return conn.execute(select(Version.value).where(Version.key == PRUNED)).scalar() or 0
+
+    def resync(self, last):
+        """
+        event telling a client changes it missed were pruned, it reloads its todos
+        :param last: int id of the last change sent on the stream
+        :return: tuple (int id of the event, str event)
+        """
+        change_id = max(last, self.latest())
+        return change_id, event(change_id, "resync", "{}")
+
+    def backlog(self, user_id, after):
+        """
+        read the changes of a user missed by a reconnecting stream, one short query per batch
+        :param user_id: int
+        :param after: int id of the last change the client received
+        :return: generator of (id, op, data)
+        """
+        while True:
+            with self.engine().connect() as conn:
+                rows = conn.execute(select(Change.id, Change.op, Change.data)
+                                    .where(Change.user_id == user_id, Change.id > after)
+                                    .order_by(Change.id).limit(BATCH)).all()
+            yield from rows
+            if len(rows) < BATCH:
+                return
+            after = rows[-1][0]
+
+    def stream(self, user_id, after=None):
+        """
+        server-sent events of the changes of a user
+        :param user_id: int
+        :param after: int Last-Event-ID sent by a reconnecting client, None for new changes only
+        :return: generator of str
+        """
+        # subscribe before reading the backlog so no change falls in between
+        subscriber = self.subscribe(user_id)
+        try:
+            # also makes the server send the headers right away
+            yield f"retry: {RETRY}\n\n"
+            last = after or 0
+            if after is not None:
+                if after < self.pruned():
+                    # a partial history would leave the client with wrong todos
+                    last, message = self.resync(last)
+                    yield message
+                else:
+                    for change_id, op, data in self.backlog(user_id, after):
+                        last = change_id
+                        yield event(change_id, op, data)
+                    # changes may have been pruned while the backlog was read
+                    if after < self.pruned():
+                        last, message = self.resync(last)
+                        yield message
+
+            while True:
+                try:
+                    change_id, op, data = subscriber.queue.get(timeout=self.keepalive)
+                except queue.Empty:
+                    if subscriber.closed:
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                # the backlog may already have sent it
+                if change_id > last:
+                    last = change_id
+                    yield event(change_id, op, data)
+                if subscriber.closed and subscriber.queue.empty():
+                    return
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def init_app(app):
+    """
+    attach the change feed to an app
+    :param app: application instance
+    :return: None
+    """
+    feed = app.extensions["change_feed"] = ChangeFeed(app, app.config["CHANGE_FEED_POLL"],
+                                                      app.config["CHANGE_FEED_KEEPALIVE"],
+                                                      app.config["CHANGE_FEED_QUEUE"],
+                                                      app.config["CHANGE_LOG_RETENTION"],
+                                                      app.config["CHANGE_LOG_PRUNE"])
+    # the poller also prunes the log, so every process runs it from its first request on
+    app.before_request(feed.start)
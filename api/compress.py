@@ -0,0 +1,161 @@
+import zlib
+from flask import request
+from .cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html")
+
+
+class GzipStream(object):
+    """
+    incremental gzip compressor
+    """
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        """
+        :return: bytes compressed so far, flushed so the client can decode them
+        """
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """
+        :return: remaining bytes
+        """
+        return self._compressor.flush()
+
+
+class BrotliStream(object):
+    """
+    incremental brotli compressor
+    """
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        """
+        :return: bytes compressed so far, flushed so the client can decode them
+        """
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        """
+        :return: remaining bytes
+        """
+        return self._compressor.finish()
+
+
+class ZstdStream(object):
+    """
+    incremental zstandard compressor
+    """
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        """
+        :return: bytes compressed so far, flushed so the client can decode them
+        """
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        """
+        :return: remaining bytes
+        """
+        return self._compressor.flush()
+
+
+def encoders():
+    """
+    get the available encodings, most preferred first
+    :return: dict of encoding name to compressor class
+    """
+    available = {}
+    if brotli is not None:
+        available["br"] = BrotliStream
+    if zstandard is not None:
+        available["zstd"] = ZstdStream
+    available["gzip"] = GzipStream
+    return available
+
+
+def compress_chunks(chunks, stream):
+    """
+    compress a streamed body chunk by chunk
+    :param chunks: iterable of bytes or str
+    :param stream: compressor
+    :return: generator of bytes
+    """
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = stream.compress(chunk)
+            if data:
+                yield data
+        yield stream.finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def init_app(app):
+    """
+    compress responses with the best encoding accepted by the client
+    :param app: application instance
+    :return: None
+    """
+    if not app.config["COMPRESS_ENABLED"]:
+        return
+
+    available = encoders()
+    level = app.config["COMPRESS_LEVEL"]
+    min_size = app.config["COMPRESS_MIN_SIZE"]
+    # compressed bodies of responses carrying an etag, keyed by (path, etag, encoding),
+    # an etag only identifies a body together with its url
+    cache = TTLCache(app.config["COMPRESS_CACHE_SIZE"]) if app.config["COMPRESS_CACHE_SIZE"] else None
+    app.extensions["compress_cache"] = cache
+
+    @app.after_request
+    def compress(response):
+        if response.status_code < 200 or response.status_code in (204, 206, 304) or \
+                "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(available)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_chunks(response.response, available[encoding](level))
+            response.headers.pop("Content-Length", None)
+            response.headers["Content-Encoding"] = encoding
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        etag = response.headers.get("ETag")
+        key = (request.path, etag, encoding)
+        body = cache.get(key) if cache is not None and etag else None
+        if body is None:
+            stream = available[encoding](level)
+            body = stream.compress(data) + stream.finish()
+            if cache is not None and etag:
+                cache.set(key, body)
+
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -1,4 +1,7 @@
 import os
+import tempfile
+from datetime import timedelta
+from sqlalchemy.pool import QueuePool
 
 class Config(object):
     """
@@ -9,15 +12,130 @@ class Config(object):
     TESTING = False
 
     SECRET_KEY = os.environ.get("SECRET_KEY") or "restapiusingflask"
-    SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(BASE, "database.db")  
+    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL") or "sqlite:///" + os.path.join(BASE, "database.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # pragmas applied to every new sqlite connection, foreign keys are needed
+    # for the todos of a deleted user to be removed by ON DELETE CASCADE
+    SQLITE_PRAGMAS = {"foreign_keys": "ON"}
+
+    # password hashing scheme and cost, older hashes are upgraded on login
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:260000"
+    PASSWORD_SALT_LENGTH = 16
+
+    # worker processes running the password hashing
+    HASH_POOL_WORKERS = os.cpu_count() or 1
+    HASH_POOL_QUEUE = 32
+    HASH_TIMEOUT = 10
+    HASH_RETRY_AFTER = 1
+
+    # request, sql and hashing metrics exported at /metrics
+    METRICS_ENABLED = True
+
+    # encode the listings with orjson when it is installed
+    JSON_FAST = True
+
+    # response compression, brotli and zstd are used when installed
+    COMPRESS_ENABLED = True
+    COMPRESS_LEVEL = 6
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_CACHE_SIZE = 1024
+
+    # keyset pagination of the listing endpoints
+    PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+
+    # maximum number of todos created by one batch request
+    TODO_BATCH_MAX = 500
+
+    # responses replayed for requests retried with the same Idempotency-Key,
+    # a duplicate waits up to IDEMPOTENCY_WAIT seconds for the first request
+    IDEMPOTENCY_CACHE_SIZE = 10000
+    IDEMPOTENCY_TTL = 86400
+    IDEMPOTENCY_WAIT = 30
+
+    # admission control: token buckets (tokens per second, burst) per user and,
+    # for the endpoints used before login, per client ip, plus the number of
+    # requests of each endpoint class running at once
+    ADMISSION_ENABLED = True
+    RATE_LIMIT = (20, 40)
+    LOGIN_RATE_LIMIT = (1, 10)
+    RATE_LIMIT_KEYS = 100000
+    CONCURRENCY_LIMITS = {"hash": 16, "write": 32, "read": 64}
+    ADMISSION_RETRY_AFTER = 1
+
+    # maximum number of requests run by one batch request
+    BATCH_MAX = 50
+
+    # group commit of single todo writes, a writer thread commits the writes
+    # queued within WRITE_WINDOW seconds in one transaction
+    WRITE_COALESCE = os.environ.get("WRITE_COALESCE") == "1"
+    WRITE_WINDOW = 0.002
+    WRITE_BATCH_MAX = 100
+
+    # read cache of the todo endpoints, kept in memory unless a redis url is set
+    TODO_CACHE_URL = os.environ.get("TODO_CACHE_URL")
+    TODO_CACHE_SIZE = 10000
+    TODO_CACHE_TTL = 60
+
+    # rows per fetch of an export and per transaction of an import
+    EXPORT_CHUNK_SIZE = 1000
+    IMPORT_CHUNK_SIZE = 1000
+
+    # background jobs, run by worker threads and leased so a job interrupted
+    # by a crash is picked up again once its lease expires
+    JOB_WORKERS = 1
+    JOB_POLL = 1.0
+    JOB_LEASE = 60
+    JOB_MAX_ATTEMPTS = 3
+    JOB_CHUNK_SIZE = 1000
+    # uploads of import jobs are spooled here until the job is done, the job
+    # workers read them from this directory so it must be shared with the app
+    JOB_SPOOL_DIR = os.environ.get("JOB_SPOOL_DIR") or os.path.join(BASE, "spool")
+
+    # change feed of the todos, one thread per process polls the change log
+    # and fans the changes out to the connected streams
+    CHANGE_FEED_POLL = 0.5
+    CHANGE_FEED_KEEPALIVE = 15
+    CHANGE_FEED_QUEUE = 1000
+    # changes older than the retention are pruned by the poller every
+    # CHANGE_LOG_PRUNE seconds, streams resuming before them are told to resync
+    CHANGE_LOG_RETENTION = timedelta(days=7)
+    CHANGE_LOG_PRUNE = 3600
+
+    # verified tokens kept in memory by token_required
+    TOKEN_CACHE_SIZE = 10000
+    TOKEN_CACHE_TTL = 300
+
+    # access tokens are short lived jwts, refresh tokens trade in for new
+    # ones without a password check and are rotated on every use
+    ACCESS_TOKEN_LIFETIME = timedelta(minutes=30)
+    REFRESH_TOKEN_LIFETIME = timedelta(days=30)
     
 
 class Production(Config):
     """
     settings to be used during production
     """
-    pass
+    # WAL lets readers run next to the single writer, writers wait for the
+    # lock up to busy_timeout instead of failing with "database is locked"
+    SQLITE_PRAGMAS = {
+        "foreign_keys": "ON",
+        "journal_mode": "WAL",
+        "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", -64000)),
+        "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 268435456)),
+        "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", 30000)),
+    }
+
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "poolclass": QueuePool,
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": 30,
+        "pool_pre_ping": True,
+        "connect_args": {"check_same_thread": False},
+    }
 
 class Development(Config):
     """
@@ -31,5 +149,11 @@ class Testing(Config):
     """
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:1000"
+    HASH_POOL_WORKERS = 0
+    JOB_WORKERS = 0
+    JOB_SPOOL_DIR = os.path.join(tempfile.gettempdir(), "api-test-spool")
+    CHANGE_FEED_POLL = 0
+    ADMISSION_ENABLED = False
 
 config = {"development": Development, "production": Production, "testing": Testing}
\ No newline at end of file
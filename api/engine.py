@@ -0,0 +1,36 @@
+import os
+from sqlalchemy import event, exc
+
+
+def init_app(app, db):
+    """
+    hook the engine of an app: apply the sqlite pragmas of the config on every
+    new connection and drop connections inherited from a parent process
+    :param app: application instance
+    :param db: SQLAlchemy extension
+    :return: None
+    """
+    engine = db.get_engine(app)
+    pragmas = app.config["SQLITE_PRAGMAS"]
+
+    if engine.dialect.name == "sqlite" and pragmas:
+        @event.listens_for(engine, "connect")
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    @event.listens_for(engine, "connect")
+    def remember_pid(dbapi_connection, connection_record):
+        connection_record.info["pid"] = os.getpid()
+
+    @event.listens_for(engine, "checkout")
+    def check_pid(dbapi_connection, connection_record, connection_proxy):
+        # a pre-fork server copies the pool into its workers, a worker must
+        # never use (or close) a connection opened by the parent
+        if connection_record.info["pid"] != os.getpid():
+            connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+            raise exc.DisconnectionError(
+                "Connection record belongs to pid {}, attempting to check out in pid {}"
+                .format(connection_record.info["pid"], os.getpid()))
@@ -0,0 +1,143 @@
+import time
+from concurrent.futures import TimeoutError
+from threading import BoundedSemaphore, Lock
+from flask import current_app, jsonify
+from werkzeug.security import generate_password_hash, check_password_hash
+from .metrics import observe_hash
+
+
+class HashPoolBusy(Exception):
+    """
+    raised when the password hashing queue is full or too slow
+    """
+
+
+class HashPool(object):
+    """
+    run the cpu heavy password hashing in worker processes with a bounded queue
+    """
+    def __init__(self, workers, max_pending, timeout):
+        """
+        :param workers: int number of worker processes, 0 to hash in the calling thread
+        :param max_pending: int maximum number of hashes running or waiting
+        :param timeout: seconds to wait for a result before giving up
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = BoundedSemaphore(max_pending) if max_pending else None
+        self._executor = None
+        self._lock = Lock()
+
+    def executor(self):
+        """
+        get the process pool, starting it on first use
+        :return: ProcessPoolExecutor
+        """
+        # imported here, apps hashing inline never load the process pool machinery
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        with self._lock:
+            if self._executor is None:
+                # spawned workers do not inherit threads or database connections
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def run(self, fn, *args, **kwargs):
+        """
+        run a function in the pool and wait for its result
+        :param fn: picklable function
+        :return: result of fn
+        """
+        if self._slots is None or not self._slots.acquire(blocking=False):
+            raise HashPoolBusy()
+
+        if not self.workers:
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self.executor().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        # the slot is held until the hash is done, not until the caller gives up on it,
+        # so hashes left behind by timed out requests still count against the queue
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            # a hash still waiting for a worker is dropped
+            future.cancel()
+            raise HashPoolBusy()
+
+    def shutdown(self):
+        """
+        stop the worker processes
+        :return: None
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+def init_app(app):
+    """
+    attach a hashing pool to the app
+    :param app: application instance
+    :return: None
+    """
+    app.extensions["hash_pool"] = HashPool(app.config["HASH_POOL_WORKERS"], app.config["HASH_POOL_QUEUE"],
+                                           app.config["HASH_TIMEOUT"])
+    app.register_error_handler(HashPoolBusy, busy)
+
+
+def busy(e):
+    """
+    fail fast while the hashing pool is saturated
+    :return: json
+    """
+    response = jsonify({"message": "Server is busy, try again later!"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(current_app.config["HASH_RETRY_AFTER"])
+    return response
+
+
+def hash_password(password):
+    """
+    hash a password with the configured scheme and cost
+    :param password: str
+    :return: str hash
+    """
+    start = time.perf_counter()
+    try:
+        return current_app.extensions["hash_pool"].run(generate_password_hash, password,
+            method=current_app.config["PASSWORD_HASH_METHOD"], salt_length=current_app.config["PASSWORD_SALT_LENGTH"])
+    finally:
+        observe_hash("generate", time.perf_counter() - start)
+
+
+def verify_password(pwhash, password):
+    """
+    check a password against a stored hash
+    :param pwhash: str stored hash
+    :param password: str
+    :return: bool
+    """
+    start = time.perf_counter()
+    try:
+        return current_app.extensions["hash_pool"].run(check_password_hash, pwhash, password)
+    finally:
+        observe_hash("check", time.perf_counter() - start)
+
+
+def needs_rehash(pwhash):
+    """
+    check if a stored hash uses another scheme or cost than the configured one
+    :param pwhash: str stored hash
+    :return: bool
+    """
+    return pwhash.split("$", 1)[0] != current_app.config["PASSWORD_HASH_METHOD"]
@@ -0,0 +1,135 @@
+import hashlib
+from functools import wraps
+from threading import Event, Lock
+from flask import current_app, g, jsonify, request
+from .cache import TTLCache
+
+# longest Idempotency-Key accepted
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore(object):
+    """
+    responses of requests sent with an Idempotency-Key, kept for their retries,
+    and the keys of the requests still running
+    """
+    def __init__(self, maxsize, ttl):
+        """
+        :param maxsize: int maximum number of stored responses
+        :param ttl: seconds a response is replayed for
+        """
+        self.responses = TTLCache(maxsize, ttl)
+        self._running = {}
+        self._lock = Lock()
+
+    def begin(self, slot, fingerprint):
+        """
+        claim a key for a request unless a response is stored or another request runs with it
+        :param slot: hashable key of the request
+        :param fingerprint: str hash of the request body
+        :return: tuple ("stored", (fingerprint, response)), ("wait", (fingerprint, Event)) or ("run", None)
+        """
+        with self._lock:
+            stored = self.responses.get(slot)
+            if stored is not None:
+                return "stored", stored
+            running = self._running.get(slot)
+            if running is not None:
+                return "wait", running
+            self._running[slot] = (fingerprint, Event())
+            return "run", None
+
+    def finish(self, slot, fingerprint, response):
+        """
+        store the response of a claimed key and wake the requests waiting for it
+        :param response: tuple (status, headers, body) or None to release the key without storing
+        :return: None
+        """
+        with self._lock:
+            if response is not None:
+                self.responses.set(slot, (fingerprint, response))
+            _, done = self._running.pop(slot)
+        done.set()
+
+
+def idempotent(owner_for=None):
+    """
+    decorator replaying the stored response of a request retried with the same
+    Idempotency-Key, a duplicate arriving while the first request still runs waits for it
+    :param owner_for: function taking the view arguments and returning the owner the
+                      keys are scoped to, None for keys shared by every client
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get("Idempotency-Key")
+            if key is None:
+                return f(*args, **kwargs)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return jsonify({"message": "Invalid idempotency key!"}), 400
+
+            store = current_app.extensions["idempotency"]
+            owner = owner_for(*args) if owner_for is not None else None
+            slot = (request.endpoint, owner, key)
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+            while True:
+                state, value = store.begin(slot, fingerprint)
+                if state == "run":
+                    break
+                if value[0] != fingerprint:
+                    return jsonify({"message": "Idempotency key was used for another request!"}), 422
+                if state == "stored":
+                    status, headers, body = value[1]
+                    response = current_app.response_class(body, status, headers)
+                    response.headers["Idempotent-Replayed"] = "true"
+                    return response
+                if not value[1].wait(current_app.config["IDEMPOTENCY_WAIT"]):
+                    return jsonify({"message": "A request with this idempotency key is in progress!"}), 409
+
+            stored = None
+            try:
+                response = current_app.make_response(f(*args, **kwargs))
+                # server errors are not stored, a retry runs again
+                if response.status_code < 500 and not response.is_streamed:
+                    stored = (response.status_code, list(response.headers.items()), response.get_data())
+                return response
+            finally:
+                pending = g.get("idempotency_pending")
+                if pending is not None:
+                    # the enclosing transaction may still be rolled back
+                    pending.append((slot, fingerprint, stored))
+                else:
+                    store.finish(slot, fingerprint, stored)
+        return wrapper
+    return decorator
+
+
+def hold_responses():
+    """
+    keep the responses of the idempotent requests run from now on in this request
+    until release_responses, for requests committed by an enclosing transaction
+    :return: None
+    """
+    g.idempotency_pending = []
+
+
+def release_responses(committed):
+    """
+    store the held responses once their transaction committed, or only free their keys
+    :param committed: bool, False if the transaction was rolled back
+    :return: None
+    """
+    store = current_app.extensions["idempotency"]
+    for slot, fingerprint, stored in g.pop("idempotency_pending", ()):
+        store.finish(slot, fingerprint, stored if committed else None)
+
+
+def init_app(app):
+    """
+    attach the store of idempotent responses to an app
+    :param app: application instance
+    :return: None
+    """
+    app.extensions["idempotency"] = IdempotencyStore(app.config["IDEMPOTENCY_CACHE_SIZE"],
+                                                     app.config["IDEMPOTENCY_TTL"])
@@ -0,0 +1,186 @@
+import json
+import os
+import shutil
+import uuid
+from flask import Blueprint, request, jsonify, current_app, url_for
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .admin import IMPORTERS, TABLES, insert_rows, invalidate_owners
+from .models import Job, ToDo, User
+from .user import invalidate_tokens, token_required
+from .versions import USERS, bump, todo_key
+from .worker import JobError, handler
+
+jobs = Blueprint("jobs", __name__, url_prefix="/api")
+
+# bytes copied at a time while spooling an upload
+SPOOL_CHUNK = 1 << 20
+
+
+@jobs.route("/jobs/remove-user/<user_id>", methods=["POST"])
+@token_required
+def remove_user(current_user, user_id):
+    """
+    delete a user and the user's todos in the background
+    :param current_user: user currently logged in
+    :param user_id: str representing public id
+    :return: json
+    """
+    if not current_user.admin:
+        return jsonify({"message": "You don't have permission to perform that function!"})
+
+    owner_id = db.session.query(User.id).filter_by(public_id=user_id).scalar()
+    if owner_id is None:
+        return jsonify({"message": "User does not exist!"})
+
+    return queued(current_app.extensions["jobs"].submit("remove-user", {"user_id": owner_id, "public_id": user_id}))
+
+
+@jobs.route("/jobs/import/<table>", methods=["POST"])
+@token_required
+def import_table(current_user, table):
+    """
+    insert the ndjson rows of the request body in the background
+    :param current_user: user currently logged in
+    :param table: str "user" or "todo"
+    :return: json
+    """
+    if not current_user.admin:
+        return jsonify({"message": "You don't have permission to perform that function!"})
+
+    if table not in TABLES:
+        return jsonify({"message": "Unknown table or format!"}), 400
+
+    # the body is copied to a file in chunks, the job reads it from there
+    spool = current_app.config["JOB_SPOOL_DIR"]
+    os.makedirs(spool, exist_ok=True)
+    path = os.path.join(spool, f"import-{uuid.uuid4().hex}.ndjson")
+    with open(path, "wb") as upload:
+        shutil.copyfileobj(request.stream, upload, SPOOL_CHUNK)
+
+    return queued(current_app.extensions["jobs"].submit("import", {"table": table, "path": path}))
+
+
+@jobs.route("/jobs/<job_id>", methods=["GET"])
+@token_required
+def get_job(current_user, job_id):
+    """
+    get the status and progress of a job
+    :param current_user: user currently logged in
+    :param job_id: str
+    :return: json
+    """
+    if not current_user.admin:
+        return jsonify({"message": "You don't have permission to perform that function!"})
+
+    job = Job.query.get(job_id)
+    if not job:
+        return jsonify({"message": "Job does not exist!"})
+
+    return jsonify({"job": job_status(job)})
+
+
+def queued(job_id):
+    """
+    answer a request whose work was handed to a job
+    :param job_id: str
+    :return: json with status 202
+    """
+    return jsonify({"message": "Job has been queued!", "job": job_id}), 202, \
+        {"Location": url_for("jobs.get_job", job_id=job_id)}
+
+
+def job_status(job):
+    """
+    describe a job for the client
+    :param job: Job
+    :return: dict
+    """
+    return {"id": job.id, "kind": job.kind, "status": job.status, "progress": job.progress, "total": job.total,
+            "result": json.loads(job.result) if job.result else None, "error": job.error,
+            "attempts": job.attempts, "created": job.created.isoformat() + "Z",
+            "updated": job.updated.isoformat() + "Z"}
+
+
+@handler("remove-user")
+def remove_user_job(job):
+    """
+    delete the todos of a user chunk by chunk, then the user, progress counts deleted todos
+    :param job: JobState
+    """
+    owner_id = job.params["user_id"]
+    chunk_size = current_app.config["JOB_CHUNK_SIZE"]
+    done = job.progress
+    total = done + db.session.query(func.count(ToDo.id)).filter_by(user_id=owner_id).scalar()
+
+    while True:
+        ids = [todo_id for todo_id, in db.session.query(ToDo.id).filter_by(user_id=owner_id).limit(chunk_size)]
+        if not ids:
+            break
+        ToDo.query.filter(ToDo.id.in_(ids)).delete(synchronize_session=False)
+        bump(todo_key(owner_id))
+        done += len(ids)
+        yield done, total, None
+        current_app.extensions["todo_cache"].invalidate(todo_key(owner_id))
+
+    User.query.filter_by(id=owner_id).delete(synchronize_session=False)
+    bump(USERS)
+    bump(todo_key(owner_id))
+    yield done, total, {"message": "User has been deleted!"}
+    invalidate_tokens(job.params["public_id"])
+    current_app.extensions["todo_cache"].invalidate(todo_key(owner_id))
+
+
+def remove_upload(params):
+    """
+    delete the spooled upload of an import job that is done or failed
+    :param params: dict params of the job
+    :return: None
+    """
+    if "path" in params and os.path.exists(params["path"]):
+        os.remove(params["path"])
+
+
+@handler("import", cleanup=remove_upload)
+def import_job(job):
+    """
+    insert the ndjson rows of a spooled upload in chunked transactions, progress
+    is the byte offset after the last committed chunk so a resumed job seeks there
+    :param job: JobState
+    """
+    table = job.params["table"]
+    path = job.params["path"]
+    chunk_size = current_app.config["IMPORT_CHUNK_SIZE"]
+    result = job.result or {"rows": 0, "lines": 0}
+    inserted, number, offset = result["rows"], result["lines"], job.progress
+
+    try:
+        upload = open(path, "rb")
+    except FileNotFoundError:
+        raise JobError("Upload of the job is missing!")
+
+    with upload:
+        size = os.fstat(upload.fileno()).st_size
+        upload.seek(offset)
+        rows = []
+        for line in upload:
+            number += 1
+            offset += len(line)
+            if line.strip():
+                try:
+                    rows.append(IMPORTERS[table](json.loads(line)))
+                except (ValueError, TypeError, KeyError):
+                    raise JobError(f"Invalid row on line {number}!")
+
+            if rows and (len(rows) == chunk_size or offset == size):
+                try:
+                    owners = insert_rows(table, rows)
+                except IntegrityError:
+                    raise JobError(f"Could not insert the rows up to line {number}!")
+                inserted += len(rows)
+                rows = []
+                yield offset, size, {"rows": inserted, "lines": number}
+                invalidate_owners(owners)
+
+    yield size, size, {"rows": inserted, "lines": number}
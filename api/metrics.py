@@ -0,0 +1,197 @@
+import time
+from bisect import bisect_left
+from threading import Lock
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+# upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _labels(names, values):
+    """
+    format label pairs for the prometheus text format
+    """
+    if not names:
+        return ""
+    pairs = ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter(object):
+    """
+    monotonically increasing value per label set
+    """
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, *labels, amount=1):
+        """
+        add to the counter of a label set
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        """
+        :return: list of (name, label str, value)
+        """
+        with self._lock:
+            return [(self.name, _labels(self.labels, labels), value) for labels, value in self._values.items()]
+
+
+class Histogram(object):
+    """
+    distribution of observed values per label set in cumulative buckets
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = Lock()
+
+    def observe(self, value, *labels):
+        """
+        record one value of a label set
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # one slot per bucket, the +Inf bucket and the sum
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        """
+        :return: list of (name, label str, value)
+        """
+        output = []
+        with self._lock:
+            values = [(labels, list(counts)) for labels, counts in self._values.items()]
+
+        for labels, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                total += count
+                output.append((self.name + "_bucket", _labels(self.labels + ("le",), labels + (bound,)), total))
+            output.append((self.name + "_sum", _labels(self.labels, labels), counts[-1]))
+            output.append((self.name + "_count", _labels(self.labels, labels), total))
+        return output
+
+
+class Metrics(object):
+    """
+    metrics of one app
+    """
+    def __init__(self):
+        self.request_duration = Histogram("http_request_duration_seconds",
+            "Duration of requests by endpoint and status", ("endpoint", "method", "status"))
+        self.sql_statements = Histogram("http_request_sql_statements",
+            "SQL statements issued per request", ("endpoint",), COUNT_BUCKETS)
+        self.sql_duration = Histogram("http_request_sql_duration_seconds",
+            "Time spent in SQL per request", ("endpoint",))
+        self.hash_duration = Histogram("password_hash_duration_seconds",
+            "Duration of password hashing including the wait for a worker", ("operation",))
+        self.collectors = [self.request_duration, self.sql_statements, self.sql_duration, self.hash_duration]
+
+    def register(self, collector):
+        """
+        add a counter or histogram to the exported metrics
+        :return: the collector
+        """
+        self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        """
+        :return: str metrics in the prometheus text format
+        """
+        lines = []
+        for collector in self.collectors:
+            lines.append(f"# HELP {collector.name} {collector.documentation}")
+            lines.append(f"# TYPE {collector.name} {collector.kind}")
+            lines += [f"{name}{labels} {value}" for name, labels, value in collector.samples()]
+
+        cache = current_app.extensions.get("todo_cache")
+        if cache is not None:
+            stats = cache.stats()
+            lines.append("# HELP todo_cache_requests_total Lookups of the todo read cache by result")
+            lines.append("# TYPE todo_cache_requests_total counter")
+            lines.append(f'todo_cache_requests_total{{result="hit"}} {stats["hits"]}')
+            lines.append(f'todo_cache_requests_total{{result="miss"}} {stats["misses"]}')
+        return "\n".join(lines) + "\n"
+
+
+def init_app(app, db):
+    """
+    instrument an app and add the /metrics endpoint
+    :param app: application instance
+    :param db: SQLAlchemy extension
+    :return: None
+    """
+    if not app.config["METRICS_ENABLED"]:
+        return
+
+    metrics = app.extensions["metrics"] = Metrics()
+    engine = db.get_engine(app)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        if has_request_context() and "sql_count" in g:
+            g.sql_count += 1
+            g.sql_time += elapsed
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_time = 0.0
+
+    @app.after_request
+    def record_request(response):
+        if "request_start" in g:
+            endpoint = request.endpoint or "none"
+            metrics.request_duration.observe(time.perf_counter() - g.request_start,
+                                             endpoint, request.method, response.status_code)
+            metrics.sql_statements.observe(g.sql_count, endpoint)
+            metrics.sql_duration.observe(g.sql_time, endpoint)
+        return response
+
+    @app.route("/metrics")
+    def export_metrics():
+        """
+        export the metrics for prometheus
+        :return: text
+        """
+        return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def observe_hash(operation, seconds):
+    """
+    record the duration of a password hash if metrics are enabled
+    :param operation: str "generate" or "check"
+    :param seconds: float duration
+    :return: None
+    """
+    metrics = current_app.extensions.get("metrics")
+    if metrics is not None:
+        metrics.hash_duration.observe(seconds, operation)
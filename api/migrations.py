@@ -0,0 +1,171 @@
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from .models import Change, Job, RefreshToken, SchemaVersion, Version
+
+
+def _lookup_indexes(conn):
+    """
+    index the columns used by login, token_required and the todo listing
+    """
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_user_name ON "user" (name)'))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_to_do_user_id ON to_do (user_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_to_do_user_id_complete ON to_do (user_id, complete)"))
+
+
+def _version_counters(conn):
+    """
+    create the table of change counters behind the etags
+    """
+    Version.__table__.create(conn, checkfirst=True)
+
+
+def _cascade_todos(conn):
+    """
+    rebuild to_do so its rows are deleted together with their user,
+    sqlite cannot alter a foreign key in place
+    """
+    foreign_keys = conn.execute(text("PRAGMA foreign_key_list(to_do)")).mappings().all()
+    if all(key["on_delete"] == "CASCADE" for key in foreign_keys):
+        return
+
+    conn.execute(text(
+        "CREATE TABLE to_do_new (id INTEGER NOT NULL, item VARCHAR(50) NOT NULL, complete BOOLEAN NOT NULL, "
+        'user_id INTEGER NOT NULL, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES "user" (id) ON DELETE CASCADE)'))
+    # todos left behind by users deleted before foreign keys were enforced are dropped
+    conn.execute(text("INSERT INTO to_do_new (id, item, complete, user_id) SELECT id, item, complete, user_id "
+                      'FROM to_do WHERE user_id IN (SELECT id FROM "user")'))
+    conn.execute(text("DROP TABLE to_do"))
+    conn.execute(text("ALTER TABLE to_do_new RENAME TO to_do"))
+    _lookup_indexes(conn)
+
+
+def _todo_search(conn):
+    """
+    create the full text index of the todo items, kept in sync by triggers,
+    the index rowid is (user_id << 32) + id so a search is scoped by a rowid range
+    """
+    conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS to_do_fts USING fts5(item, content='', prefix='2 3')"))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS to_do_fts_insert AFTER INSERT ON to_do BEGIN "
+        "INSERT INTO to_do_fts (rowid, item) VALUES ((new.user_id << 32) + new.id, new.item); END"))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS to_do_fts_delete AFTER DELETE ON to_do BEGIN "
+        "INSERT INTO to_do_fts (to_do_fts, rowid, item) VALUES ('delete', (old.user_id << 32) + old.id, old.item); "
+        "END"))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS to_do_fts_update AFTER UPDATE OF item, user_id ON to_do BEGIN "
+        "INSERT INTO to_do_fts (to_do_fts, rowid, item) VALUES ('delete', (old.user_id << 32) + old.id, old.item); "
+        "INSERT INTO to_do_fts (rowid, item) VALUES ((new.user_id << 32) + new.id, new.item); END"))
+    # a contentless index can not be deleted from, delete-all empties it for a re-run
+    conn.execute(text("INSERT INTO to_do_fts (to_do_fts) VALUES ('delete-all')"))
+    conn.execute(text("INSERT INTO to_do_fts (rowid, item) SELECT (user_id << 32) + id, item FROM to_do"))
+
+
+def _refresh_tokens(conn):
+    """
+    create the table tracking the issued refresh tokens
+    """
+    RefreshToken.__table__.create(conn, checkfirst=True)
+
+
+def _jobs(conn):
+    """
+    create the table of background jobs
+    """
+    Job.__table__.create(conn, checkfirst=True)
+
+
+def _change_log(conn):
+    """
+    create the change log behind the todo change feed
+    """
+    Change.__table__.create(conn, checkfirst=True)
+
+
+def _change_times(conn):
+    """
+    record when a change was logged so old changes can be pruned
+    """
+    columns = {column["name"] for column in conn.execute(text("PRAGMA table_info(change)")).mappings()}
+    if "created" not in columns:
+        conn.execute(text("ALTER TABLE change ADD COLUMN created DATETIME"))
+
+
+def _job_payloads(conn):
+    """
+    drop the payload column of the jobs, uploads are spooled to files
+    """
+    columns = {column["name"] for column in conn.execute(text("PRAGMA table_info(job)")).mappings()}
+    if "payload" in columns:
+        conn.execute(text("ALTER TABLE job DROP COLUMN payload"))
+
+
+# ordered (version, description, function) steps bringing a database up to date,
+# each step must also be safe to run on a database created by create_all
+MIGRATIONS = [
+    (1, "lookup indexes on user and to_do", _lookup_indexes),
+    (2, "change counters", _version_counters),
+    (3, "cascade todo deletion", _cascade_todos),
+    (4, "full text search of todos", _todo_search),
+    (5, "refresh tokens", _refresh_tokens),
+    (6, "background jobs", _jobs),
+    (7, "todo change log", _change_log),
+    (8, "change log timestamps", _change_times),
+    (9, "job payloads", _job_payloads),
+]
+
+HEAD = MIGRATIONS[-1][0]
+
+
+def lock(conn):
+    """
+    take the write lock of a sqlite database for the transaction of a connection,
+    so workers starting at the same time migrate one after another
+    :param conn: sqlalchemy connection inside a transaction
+    :return: None
+    """
+    if conn.dialect.name == "sqlite":
+        # pysqlite begins its transaction lazily and only with a shared lock
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def current_version(conn):
+    """
+    get the schema version of a database
+    :param conn: sqlalchemy connection
+    :return: int version, 0 if no migration was applied yet
+    """
+    SchemaVersion.__table__.create(conn, checkfirst=True)
+    return conn.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+
+
+def stored_version(engine):
+    """
+    read the schema version of a database without creating anything, one query
+    :param engine: sqlalchemy engine of the database
+    :return: int version, None if the database has no version table yet
+    """
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        return None
+
+
+def upgrade(engine):
+    """
+    apply the pending migrations, one locked transaction per step. The version is
+    read again under the lock, a step applied meanwhile by another process is skipped
+    :param engine: sqlalchemy engine of the database
+    :return: list of applied versions
+    """
+    applied = []
+    for step, _, migrate in MIGRATIONS:
+        with engine.begin() as conn:
+            lock(conn)
+            if current_version(conn) >= step:
+                continue
+            migrate(conn)
+            conn.execute(SchemaVersion.__table__.insert().values(version=step))
+        applied.append(step)
+    return applied
@@ -7,10 +7,11 @@ class User(db.Model):
     """
     id = db.Column(db.Integer, primary_key=True)
     public_id = db.Column(db.String(100), unique=True, nullable=False)
-    name = db.Column(db.String(50), nullable=False)
+    name = db.Column(db.String(50), nullable=False, index=True)
     password = db.Column(db.String(100), nullable=False)
     admin = db.Column(db.Boolean, nullable=False)
-    todo = db.relationship("ToDo", backref="user", lazy=True)
+    # todos are removed by the database, deleting a user never loads them
+    todo = db.relationship("ToDo", backref="user", lazy=True, passive_deletes=True)
 
     def __repr__(self):
         return "User({}, {}, {})".format(self.name, self.public_id, self.admin)
@@ -22,7 +23,68 @@ class ToDo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     item = db.Column(db.String(50), nullable=False)
     complete = db.Column(db.Boolean, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    __table_args__ = (db.Index("ix_to_do_user_id_complete", "user_id", "complete"),)
 
     def __repr__(self):
         return "Todo({}, {})".format(self.item, self.complete)
+
+class SchemaVersion(db.Model):
+    """
+    create a database table recording the applied schema migrations
+    """
+    version = db.Column(db.Integer, primary_key=True)
+
+class Version(db.Model):
+    """
+    create a database table of counters bumped by every change of a resource
+    """
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Integer, nullable=False)
+
+class RefreshToken(db.Model):
+    """
+    create a database table of issued refresh tokens, only their sha256 is stored
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    # tokens rotated from one login share a family, reusing a spent token revokes it
+    family = db.Column(db.String(36), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False, index=True)
+    expires = db.Column(db.DateTime, nullable=False)
+    revoked = db.Column(db.Boolean, nullable=False, default=False)
+
+class Job(db.Model):
+    """
+    create a database table of background jobs, a job survives a restart of the app
+    """
+    id = db.Column(db.String(36), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    result = db.Column(db.Text)
+    error = db.Column(db.String(200))
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # a running job whose lease expired was interrupted and is claimed again
+    lease = db.Column(db.DateTime)
+    created = db.Column(db.DateTime, nullable=False)
+    updated = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (db.Index("ix_job_status_created", "status", "created"),)
+
+class Change(db.Model):
+    """
+    create a database table logging every change of the todos, the ids
+    only grow so they serve as event ids of the change feed
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    op = db.Column(db.String(20), nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    # changes older than CHANGE_LOG_RETENTION are pruned, rows logged before this column have none
+    created = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index("ix_change_user_id_id", "user_id", "id"), {"sqlite_autoincrement": True})
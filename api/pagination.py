@@ -0,0 +1,97 @@
+import base64
+import binascii
+import json
+import math
+from flask import current_app, request
+
+# largest value sqlite stores in an INTEGER column
+MAX_INTEGER = 2 ** 63 - 1
+
+
+class PaginationError(ValueError):
+    """
+    raised when the paging or search arguments of a request are invalid
+    """
+
+
+def encode_cursor(position):
+    """
+    build an opaque cursor pointing after a row
+    :param position: json serializable keyset of the last row on the current page
+    :return: str cursor
+    """
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    read the keyset back out of a cursor
+    :param cursor: str cursor created by encode_cursor
+    :return: keyset of the last row already returned
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError, binascii.Error):
+        raise PaginationError("Invalid cursor!")
+
+
+def valid_key(value, signed=False):
+    """
+    check a value of a keyset read from a cursor can be bound to a query
+    :param value: parsed json
+    :param signed: bool, also accept negative and fractional numbers
+    :return: bool
+    """
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return (-MAX_INTEGER if signed else 0) <= value <= MAX_INTEGER
+    return signed and isinstance(value, float) and math.isfinite(value)
+
+
+def page_limit():
+    """
+    read the page size of the current request
+    :return: int
+    """
+    limit = request.args.get("limit", current_app.config["PAGE_SIZE"])
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise PaginationError("Invalid limit!")
+
+    if limit < 1:
+        raise PaginationError("Invalid limit!")
+    return min(limit, current_app.config["MAX_PAGE_SIZE"])
+
+
+def page_args():
+    """
+    read the limit and cursor of the current request
+    :return: tuple of (limit, last_id)
+    """
+    limit = page_limit()
+    cursor = request.args.get("next")
+    last_id = decode_cursor(cursor) if cursor else 0
+
+    if not valid_key(last_id):
+        raise PaginationError("Invalid cursor!")
+    return limit, last_id
+
+
+def paginate(query, column, limit, last_id):
+    """
+    fetch one page of a query using the keyset on an id column
+    :param query: query to paginate
+    :param column: indexed, unique and increasing column to page on
+    :param limit: int maximum number of rows on the page
+    :param last_id: int value of column on the last row already returned
+    :return: tuple of (rows, cursor for the next page or None)
+    """
+    rows = query.filter(column > last_id).order_by(column).limit(limit + 1).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].id)
+    return rows, None
@@ -0,0 +1,67 @@
+import re
+from sqlalchemy import text
+from . import db
+from .pagination import PaginationError, encode_cursor, valid_key
+
+# words of a search, a trailing * asks for a prefix match
+WORD = re.compile(r"\w+\*?", re.UNICODE)
+MAX_WORDS = 16
+
+# largest ids packed into the index rowid of a todo, imports reject larger ones
+MAX_TODO_ID = (1 << 32) - 1
+MAX_USER_ID = (1 << 31) - 1
+
+# the index rowid of a todo is (user_id << 32) + id, the rowid range of a user
+# limits the search to the user's todos, smaller bm25 ranks are better matches.
+# The join checks the owner again so a rowid can never match another user's todo
+SEARCH = """
+    SELECT t.id, t.item, t.complete, f.rank FROM (
+        SELECT rowid, bm25(to_do_fts) AS rank FROM to_do_fts
+        WHERE to_do_fts MATCH :match AND rowid BETWEEN :low AND :high
+    ) AS f JOIN to_do AS t ON t.id = (f.rowid & 4294967295) AND t.user_id = :user_id
+    {after}
+    ORDER BY f.rank, t.id
+    LIMIT :limit
+"""
+
+
+def match_expression(query):
+    """
+    build an fts5 query from user input, every word is quoted so no fts syntax is passed through
+    :param query: str search entered by the user
+    :return: str match expression
+    """
+    words = WORD.findall(query)
+    if not words or len(words) > MAX_WORDS:
+        raise PaginationError("Invalid search query!")
+
+    return " ".join('"{}"*'.format(word[:-1]) if word.endswith("*") else '"{}"'.format(word) for word in words)
+
+
+def search_todos(user_id, query, limit, after=None):
+    """
+    get a page of the todos of a user matching a search, best matches first
+    :param user_id: int id of the owner
+    :param query: str search entered by the user
+    :param limit: int maximum number of todos
+    :param after: [rank, id] keyset of the last todo already returned
+    :return: tuple of (list of dicts, cursor for the next page or None)
+    """
+    params = {"match": match_expression(query), "user_id": user_id, "low": user_id << 32, "high": ((user_id + 1) << 32) - 1,
+              "limit": limit + 1}
+    condition = ""
+
+    if after is not None:
+        if not isinstance(after, list) or len(after) != 2 or \
+                not valid_key(after[0], signed=True) or not valid_key(after[1]):
+            raise PaginationError("Invalid cursor!")
+        params["rank"], params["id"] = after
+        condition = "WHERE (f.rank, t.id) > (:rank, :id)"
+
+    rows = db.session.execute(text(SEARCH.format(after=condition)), params).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1].rank, rows[-1].id])
+
+    return [{"id": row.id, "item": row.item, "complete": bool(row.complete)} for row in rows], next_cursor
@@ -0,0 +1,46 @@
+import json
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(obj):
+    """
+    encode with the standard library
+    :return: bytes
+    """
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def init_app(app):
+    """
+    pick the json encoder used by the listing endpoints, orjson when installed
+    :param app: application instance
+    :return: None
+    """
+    fast = app.config["JSON_FAST"] and orjson is not None
+    app.extensions["json_dumps"] = orjson.dumps if fast else _dumps
+
+
+def json_response(obj, status=200):
+    """
+    encode a payload of plain dicts, lists and scalars without going through the json encoder class
+    :param obj: payload
+    :param status: int http status
+    :return: response
+    """
+    return current_app.response_class(current_app.extensions["json_dumps"](obj), status=status,
+                                      mimetype="application/json")
+
+
+def rows_to_dicts(rows, keys):
+    """
+    turn projected rows into dicts
+    :param rows: iterable of tuples
+    :param keys: tuple of key names, one per column of a row
+    :return: list of dicts
+    """
+    return [dict(zip(keys, row)) for row in rows]
@@ -1,12 +1,25 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import func
 from .models import ToDo
 from . import db
+from .changes import record
+from .idempotency import idempotent
+from .pagination import PaginationError, decode_cursor, page_args, page_limit, paginate, valid_key
+from .search import search_todos
+from .serialize import json_response, rows_to_dicts
 from .user import token_required
+from .versions import bump, conditional, current, todo_key
+from .writes import write
 
 todo = Blueprint("todo", __name__, url_prefix="/api")
 
+# columns returned by the todo endpoints, selected without loading ToDo objects
+TODO_COLUMNS = (ToDo.id, ToDo.item, ToDo.complete)
+TODO_KEYS = ("id", "item", "complete")
+
 @todo.route("/todo", methods=["POST"])
 @token_required
+@idempotent(lambda current_user: current_user.id)
 def create_todo(current_user):
     """
     create a new todo
@@ -15,31 +28,168 @@ def create_todo(current_user):
     """
     data = request.get_json()
     
-    todo = ToDo(item=data["item"], user_id=current_user.id, complete=False)
-    db.session.add(todo)
-    db.session.commit()
+    write(add_todo, current_user.id, data["item"])
+    invalidate(current_user.id)
 
     return jsonify({"message": "New todo created!"})
 
+@todo.route("/todo/batch", methods=["POST"])
+@token_required
+def create_todos(current_user):
+    """
+    create several todos in a single transaction
+    :param current_user: user currently logged in
+    :return: json 
+    """
+    data = request.get_json(silent=True)
+
+    if not isinstance(data, list) or not data or \
+            not all(isinstance(entry, dict) and isinstance(entry.get("item"), str) for entry in data):
+        return jsonify({"message": "Expected a list of todos!"}), 400
+
+    if len(data) > current_app.config["TODO_BATCH_MAX"]:
+        return jsonify({"message": "Too many todos in one batch!"}), 413
+
+    rows = [{"item": entry["item"], "user_id": current_user.id, "complete": False} for entry in data]
+    db.session.execute(ToDo.__table__.insert(), rows)
+
+    # the write lock is held until commit, so the newest ids of the user are the inserted ones
+    ids = db.session.query(ToDo.id).filter_by(user_id=current_user.id).order_by(ToDo.id.desc()).limit(len(rows))
+    ids = [todo_id for todo_id, in ids][::-1]
+    record(current_user.id, "create", {"todos": [{"id": todo_id, "item": row["item"], "complete": False}
+                                                 for todo_id, row in zip(ids, rows)]})
+    bump(todo_key(current_user.id))
+    db.session.commit()
+    invalidate(current_user.id)
+
+    return jsonify({"message": "New todos created!", "ids": ids})
+
+@todo.route("/todo/batch", methods=["PUT"])
+@token_required
+def complete_todos(current_user):
+    """
+    mark several todos as completed with a single statement
+    :param current_user: user currently logged in
+    :return: json 
+    """
+    todos = selected_todos(current_user, request.get_json(silent=True))
+    if todos is None:
+        return jsonify({"message": "Expected a list of ids or a filter!"}), 400
+
+    count = todos.update({"complete": True}, synchronize_session=False)
+    if count:
+        record(current_user.id, "complete", selection(request.get_json()))
+    bump(todo_key(current_user.id))
+    db.session.commit()
+    invalidate(current_user.id)
+
+    return jsonify({"message": "Todo items have been updated as complete!", "count": count})
+
+@todo.route("/todo/batch", methods=["DELETE"])
+@token_required
+def delete_todos(current_user):
+    """
+    delete several todos with a single statement
+    :param current_user: user currently logged in
+    :return: json 
+    """
+    todos = selected_todos(current_user, request.get_json(silent=True))
+    if todos is None:
+        return jsonify({"message": "Expected a list of ids or a filter!"}), 400
+
+    count = todos.delete(synchronize_session=False)
+    if count:
+        record(current_user.id, "delete", selection(request.get_json()))
+    bump(todo_key(current_user.id))
+    db.session.commit()
+    invalidate(current_user.id)
+
+    return jsonify({"message": "Todo items deleted!", "count": count})
+
 @todo.route("/todo", methods=["GET"])
 @token_required
+@conditional(lambda current_user: todo_key(current_user.id))
 def get_todos(current_user):
     """
-    get all todos created by a user
+    get a page of the todos created by a user
     :param current_user: user currently logged in
     :return: json 
     """
-    todos = ToDo.query.filter_by(user_id=current_user.id).all()
-    output = []
+    try:
+        limit, last_id = page_args()
+    except PaginationError as e:
+        return jsonify({"message": str(e)}), 400
 
-    for todo in todos:
-        todo_data = {}
-        todo_data["id"] = todo.id
-        todo_data["item"] = todo.item
-        todo_data["complete"] = todo.complete
-        output.append(todo_data)
+    complete = request.args.get("complete")
+    if complete not in (None, "true", "false"):
+        return jsonify({"message": "Invalid filter!"}), 400
+    complete = None if complete is None else complete == "true"
+
+    page = cached(current_user.id, f"list:{limit}:{last_id}:{complete}",
+                  lambda: todo_page(current_user.id, limit, last_id, complete))
+    return json_response(page)
+
+@todo.route("/todo/stats", methods=["GET"])
+@token_required
+@conditional(lambda current_user: todo_key(current_user.id))
+def get_stats(current_user):
+    """
+    count the todos of a user
+    :param current_user: user currently logged in
+    :return: json 
+    """
+    stats = cached(current_user.id, "stats", lambda: todo_stats(current_user.id))
+    return json_response(stats)
+
+@todo.route("/todo/search", methods=["GET"])
+@token_required
+def search(current_user):
+    """
+    search the todos of a user, best matches first
+    :param current_user: user currently logged in
+    :return: json 
+    """
+    try:
+        limit = page_limit()
+        cursor = request.args.get("next")
+        todos, next_cursor = search_todos(current_user.id, request.args.get("q", ""), limit,
+                                          decode_cursor(cursor) if cursor else None)
+    except PaginationError as e:
+        return jsonify({"message": str(e)}), 400
+
+    return json_response({"todos": todos, "next": next_cursor})
+
+@todo.route("/todo/changes", methods=["GET"])
+@token_required
+def changes(current_user):
+    """
+    stream the changes of the todos of a user as server-sent events, a reconnecting
+    client gets the changes after its Last-Event-ID first
+    :param current_user: user currently logged in
+    :return: text/event-stream
+    """
+    after = request.headers.get("Last-Event-ID", request.args.get("last_event_id"))
+    if after is not None:
+        if not (after.isascii() and after.isdigit()) or not valid_key(int(after)):
+            return jsonify({"message": "Invalid event id!"}), 400
+        after = int(after)
+
+    stream = current_app.extensions["change_feed"].stream(current_user.id, after)
+    return current_app.response_class(stream, mimetype="text/event-stream",
+                                      headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@todo.route("/todo/cache", methods=["GET"])
+@token_required
+def get_cache_stats(current_user):
+    """
+    get the hit and miss counters of the todo read cache
+    :param current_user: user currently logged in
+    :return: json 
+    """
+    if not current_user.admin:
+        return jsonify({"message": "You don't have permission to perform that function!"})
 
-    return jsonify({"todos": output})
+    return jsonify(current_app.extensions["todo_cache"].stats())
 
 @todo.route("/todo/<todo_id>", methods = ["GET"])
 @token_required
@@ -50,21 +200,15 @@ def get_todo(current_user, todo_id):
     :param todo_id: int 
     :return: json 
     """
-    todo = ToDo.query.filter_by(id = todo_id).first()
-
-    if not todo:
+    todo_id = parse_id(todo_id)
+    if todo_id is None:
         return jsonify({"message": "Todo does not exist!"})
 
-    elif not todo.user_id == current_user.id:
-        return jsonify({"message": "You don't have permission to perform that function!"})
-
-    todo_data = {}
-    todo_data["id"] = todo.id
-    todo_data["item"] = todo.item
-    todo_data["complete"] = todo.complete
-    output = [todo_data]
+    todo_data = cached(current_user.id, f"todo:{todo_id}", lambda: owned_todo(current_user.id, todo_id))
+    if todo_data is None:
+        return missing_todo(todo_id)
 
-    return jsonify({"todo": output})
+    return json_response({"todo": [todo_data]})
 
 @todo.route("/todo/<todo_id>", methods=["PUT"])
 @token_required
@@ -75,15 +219,14 @@ def complete_todo(current_user, todo_id):
     :param todo_id: int 
     :return: json 
     """
-    todo = ToDo.query.filter_by(id=todo_id).first()
-    if not todo:
+    todo_id = parse_id(todo_id)
+    if todo_id is None:
         return jsonify({"message": "Todo does not exist!"})
 
-    elif not todo.user_id == current_user.id:
-        return jsonify({"message": "You don't have permission to perform that function!"})
+    if not write(mark_complete, current_user.id, todo_id):
+        return missing_todo(todo_id)
 
-    todo.complete = True
-    db.session.commit()
+    invalidate(current_user.id)
 
     return jsonify({"message": "Todo item has been updated as complete!"})
 
@@ -96,15 +239,159 @@ def delete_todo(current_user, todo_id):
     :param todo_id: int
     :return: json 
     """
-    
-    todo = ToDo.query.filter_by(id=todo_id).first()
-    if not todo:
+    todo_id = parse_id(todo_id)
+    if todo_id is None:
         return jsonify({"message": "Todo does not exist!"})
-    
-    elif not todo.user_id == current_user.id:
-        return jsonify({"message": "You don't have permission to perform that function!"})
 
-    db.session.delete(todo)
+    deleted = ToDo.query.filter_by(id=todo_id, user_id=current_user.id).delete(synchronize_session=False)
+    if not deleted:
+        return missing_todo(todo_id)
+
+    record(current_user.id, "delete", {"ids": [todo_id]})
+    bump(todo_key(current_user.id))
     db.session.commit()
+    invalidate(current_user.id)
+
+    return jsonify({"message": "Todo item deleted!"})
+
+# filters accepted by the bulk endpoints, mapped to the complete column
+FILTERS = {"all": None, "open": False, "completed": True}
+
+def selected_todos(current_user, data):
+    """
+    build the owner scoped query of a bulk request
+    :param current_user: user currently logged in
+    :param data: json body with either a list of "ids" or a "filter"
+    :return: query or None if the body is invalid
+    """
+    if not isinstance(data, dict):
+        return None
+
+    todos = ToDo.query.filter_by(user_id=current_user.id)
+    if "ids" in data:
+        ids = data["ids"]
+        if not isinstance(ids, list) or not ids or len(ids) > current_app.config["TODO_BATCH_MAX"] or \
+                not all(isinstance(todo_id, int) and not isinstance(todo_id, bool) for todo_id in ids):
+            return None
+        return todos.filter(ToDo.id.in_(ids))
+
+    if data.get("filter") in FILTERS:
+        complete = FILTERS[data["filter"]]
+        return todos if complete is None else todos.filter_by(complete=complete)
+    return None
+
+def add_todo(user_id, item):
+    """
+    add a todo, run by write so it may be committed together with other requests
+    :param user_id: int id of the owner
+    :param item: str
+    :return: None
+    """
+    todo = ToDo(item=item, user_id=user_id, complete=False)
+    db.session.add(todo)
+    db.session.flush()
+    record(user_id, "create", {"todos": [{"id": todo.id, "item": item, "complete": False}]})
+    bump(todo_key(user_id))
+
+def mark_complete(user_id, todo_id):
+    """
+    mark a todo of a user as completed, run by write
+    :param user_id: int id of the owner
+    :param todo_id: int
+    :return: int number of updated todos
+    """
+    updated = ToDo.query.filter_by(id=todo_id, user_id=user_id).update({"complete": True}, synchronize_session=False)
+    if updated:
+        record(user_id, "complete", {"ids": [todo_id]})
+        bump(todo_key(user_id))
+    return updated
+
+def selection(data):
+    """
+    describe the todos chosen by a bulk request for the change log
+    :param data: json body validated by selected_todos
+    :return: dict with the "ids" or the "filter"
+    """
+    if "ids" in data:
+        return {"ids": data["ids"]}
+    return {"filter": data["filter"]}
+
+def parse_id(todo_id):
+    """
+    read the todo id of a url, sqlite would also match a row to ids like "1.0"
+    :param todo_id: str
+    :return: int or None if not a valid id
+    """
+    if not (todo_id.isascii() and todo_id.isdigit()) or not valid_key(int(todo_id)):
+        return None
+    return int(todo_id)
+
+def missing_todo(todo_id):
+    """
+    explain why an owner scoped statement did not match a todo
+    :param todo_id: int
+    :return: json
+    """
+    if db.session.query(ToDo.id).filter_by(id=todo_id).first() is None:
+        return jsonify({"message": "Todo does not exist!"})
+    return jsonify({"message": "You don't have permission to perform that function!"})
+
+def todo_page(user_id, limit, last_id, complete=None):
+    """
+    build a page of the todo listing
+    :param user_id: int id of the owner
+    :param limit: int maximum number of todos
+    :param last_id: int id of the last todo already returned
+    :param complete: bool to only list completed or open todos, None for all
+    :return: dict
+    """
+    todos = db.session.query(*TODO_COLUMNS).filter(ToDo.user_id == user_id)
+    if complete is not None:
+        todos = todos.filter(ToDo.complete == complete)
 
-    return jsonify({"message": "Todo item deleted!"})
\ No newline at end of file
+    todos, next_cursor = paginate(todos, ToDo.id, limit, last_id)
+    return {"todos": rows_to_dicts(todos, TODO_KEYS), "next": next_cursor}
+
+def todo_stats(user_id):
+    """
+    count the completed and open todos of a user with one grouped query on the (user_id, complete) index
+    :param user_id: int id of the owner
+    :return: dict
+    """
+    counts = dict(db.session.query(ToDo.complete, func.count()).filter(ToDo.user_id == user_id)
+                  .group_by(ToDo.complete).all())
+    completed, open_ = counts.get(True, 0), counts.get(False, 0)
+    return {"total": completed + open_, "completed": completed, "open": open_}
+
+def owned_todo(user_id, todo_id):
+    """
+    get a todo of a user
+    :param user_id: int id of the owner
+    :param todo_id: int
+    :return: dict or None if the user has no such todo
+    """
+    todo = db.session.query(*TODO_COLUMNS).filter(ToDo.id == todo_id, ToDo.user_id == user_id).first()
+    if not todo:
+        return None
+    return dict(zip(TODO_KEYS, todo))
+
+def cached(user_id, variant, load):
+    """
+    read through the todo cache under the change counter of a user, a write
+    committed by any process moves the reads to new entries
+    :param user_id: int id of the owner
+    :param variant: str identifying the read
+    :param load: function without arguments returning the payload
+    :return: payload
+    """
+    key = todo_key(user_id)
+    return current_app.extensions["todo_cache"].get_or_set(key, f"{current(key)}:{variant}", load)
+
+def invalidate(user_id):
+    """
+    drop the cached reads of a user and wake the change feed after a change of the user's todos
+    :param user_id: int id of the owner
+    :return: None
+    """
+    current_app.extensions["todo_cache"].invalidate(todo_key(user_id))
+    current_app.extensions["change_feed"].notify()
@@ -1,15 +1,29 @@
-import jwt
+import hashlib
+import secrets
+import time
 import uuid
-from datetime import datetime, timedelta
+from collections import namedtuple
+from datetime import datetime
 from functools import wraps
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, g
 from flask.helpers import make_response
-from werkzeug.security import generate_password_hash, check_password_hash
 from . import db
-from .models import User
+from .hashing import HashPoolBusy, hash_password, needs_rehash, verify_password
+from .idempotency import idempotent
+from .models import RefreshToken, User
+from .pagination import PaginationError, page_args, paginate
+from .serialize import json_response, rows_to_dicts
+from .versions import USERS, bump, conditional, todo_key
 
 user = Blueprint("user", __name__, url_prefix="/api")
 
+# lightweight record of the logged in user kept in the token cache
+AuthUser = namedtuple("AuthUser", ["id", "public_id", "name", "admin"])
+
+# columns returned by the user endpoints, selected without loading User objects
+USER_COLUMNS = (User.public_id, User.name, User.password, User.admin)
+USER_KEYS = ("public_id", "name", "password", "admin")
+
 @user.route("/login")
 def login():
     """
@@ -25,23 +39,105 @@ def login():
     if not user:
         return make_response("Could not verify!", 401, {"WWW-Authenticate": "Basic relam='Login Required!"})
         
-    if check_password_hash(user.password, auth["password"]):
-        payload = {"public_id": user.public_id, 
-                   "exp": datetime.utcnow() + timedelta(minutes=30)}
-        
-        token = jwt.encode(payload, current_app.config["SECRET_KEY"], algorithm="HS256")
-        return make_response(jsonify({"token": token}), 201)
+    if verify_password(user.password, auth["password"]):
+        if needs_rehash(user.password):
+            upgrade_password(user, auth["password"])
+
+        # expired refresh tokens of the user are dropped as new ones are issued
+        RefreshToken.query.filter(RefreshToken.user_id == user.id,
+                                  RefreshToken.expires < datetime.utcnow()).delete(synchronize_session=False)
+        tokens = issue_tokens(user.id, user.public_id)
+        db.session.commit()
+        return make_response(jsonify(tokens), 201)
     
     return make_response("Could not verify!", 401, {"WWW-Authenticate": "Basic realm='Wrong Password!'"})
 
+def upgrade_password(user, password):
+    """
+    store a password again using the configured hashing scheme and cost
+    :param user: User who just logged in with the password
+    :param password: str
+    :return: None
+    """
+    try:
+        user.password = hash_password(password)
+    except HashPoolBusy:
+        # keep the old hash, the next login tries again
+        return
+    bump(USERS)
+    db.session.commit()
+
+@user.route("/token/refresh", methods=["POST"])
+def refresh_token():
+    """
+    trade a refresh token for a new access token and a new refresh token,
+    no password is checked so this is cheap compared to login
+    :return: json
+    """
+    data = request.get_json(silent=True)
+    token = data.get("refresh_token") if isinstance(data, dict) else None
+    if not isinstance(token, str) or not token:
+        return jsonify({"message": "No refresh token found!"}), 401
+
+    stored = RefreshToken.query.filter_by(token_hash=token_digest(token)).first()
+    if not stored or stored.expires < datetime.utcnow():
+        return jsonify({"message": "Invalid refresh token!"}), 401
+
+    # spend the token, of two requests racing with the same token only one updates the row
+    spent = RefreshToken.query.filter_by(id=stored.id, revoked=False) \
+                              .update({"revoked": True}, synchronize_session=False)
+    if not spent:
+        # a spent token was presented again, it may have been stolen so the
+        # whole chain of tokens issued from that login is revoked
+        RefreshToken.query.filter_by(family=stored.family) \
+                          .update({"revoked": True}, synchronize_session=False)
+        db.session.commit()
+        return jsonify({"message": "Invalid refresh token!"}), 401
+
+    public_id = db.session.query(User.public_id).filter_by(id=stored.user_id).scalar()
+    tokens = issue_tokens(stored.user_id, public_id, stored.family)
+    db.session.commit()
+    return make_response(jsonify(tokens), 201)
+
+def issue_tokens(user_id, public_id, family=None):
+    """
+    create an access token and a refresh token, the caller commits the session
+    :param user_id: int id of the user
+    :param public_id: str public id of the user
+    :param family: str family of the refresh token being rotated, None for a new login
+    :return: dict with the token and the refresh_token
+    """
+    import jwt
+
+    now = datetime.utcnow()
+    payload = {"public_id": public_id,
+               "exp": now + current_app.config["ACCESS_TOKEN_LIFETIME"]}
+    token = jwt.encode(payload, current_app.config["SECRET_KEY"], algorithm="HS256")
+
+    refresh = secrets.token_urlsafe(32)
+    db.session.add(RefreshToken(token_hash=token_digest(refresh),
+                                family=family or str(uuid.uuid4()),
+                                user_id=user_id,
+                                expires=now + current_app.config["REFRESH_TOKEN_LIFETIME"]))
+    return {"token": token, "refresh_token": refresh}
+
+def token_digest(token):
+    """
+    hash a refresh token for storage, the tokens are random so no salt or stretching is needed
+    :param token: str refresh token
+    :return: str hex sha256
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
 @user.route("/sign-up", methods=["POST"]) 
+@idempotent()
 def sign_up():
     """
     create/register a new user
     :return: json
     """
     data = request.get_json()
-    hash_pass = generate_password_hash(data["password"], method="sha256")
+    hash_pass = hash_password(data["password"])
     
     # first user is created as admin
     if User.query.filter_by(id=1).count() == 0:
@@ -49,6 +145,7 @@ def sign_up():
     else:
         user = User(public_id = str(uuid.uuid4()), password=hash_pass, name = data["name"], admin=False)
     db.session.add(user)
+    bump(USERS)
     db.session.commit()
     return jsonify({"message": "New user has been created!"})
 
@@ -59,6 +156,11 @@ def token_required(f):
     """
     @wraps(f)
     def wrapper(*args, **kwargs):
+        # the requests of a batch share the user the batch was authenticated as
+        current_user = g.get("batch_user")
+        if current_user is not None:
+            return f(current_user, *args, **kwargs)
+
         token = None
 
         if "x-access-token" in request.headers:
@@ -67,12 +169,9 @@ def token_required(f):
         # 401 error returned if token is not passed in the header
         if not token:
             return jsonify({"message": "No token found!"}), 401
-        
-        # get stored info by decoding the payload
-        try:
-            data = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=["HS256"])
-            current_user = User.query.filter_by(public_id=data["public_id"]).first()
-        except:
+
+        current_user = authenticate(token)
+        if current_user is None:
             return jsonify({"message": "Invalid Token!"}), 401
         
         # return current logged in user context
@@ -80,11 +179,53 @@ def token_required(f):
     
     return wrapper
 
+def authenticate(token):
+    """
+    get the user a token belongs to, verifying it on a cache miss
+    :param token: str jwt sent by the client
+    :return: AuthUser or None if the token is invalid
+    """
+    cache = current_app.extensions["token_cache"]
+    current_user = cache.get(token)
+    if current_user is not None:
+        return current_user
+
+    # jwt loads its crypto backends on import, it is only needed once a token
+    # is issued or misses the cache so it stays out of app startup
+    import jwt
+
+    # get stored info by decoding the payload
+    try:
+        data = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=["HS256"])
+        user = User.query.filter_by(public_id=data["public_id"]).first()
+    except Exception:
+        return None
+
+    if not user:
+        return None
+
+    current_user = AuthUser(user.id, user.public_id, user.name, user.admin)
+    # entries never outlive the token itself
+    ttl = cache.ttl
+    if "exp" in data:
+        ttl = min(ttl, data["exp"] - time.time())
+    cache.set(token, current_user, ttl)
+    return current_user
+
+def invalidate_tokens(public_id):
+    """
+    drop the cached tokens of a user after the user changed
+    :param public_id: str public id of the user
+    :return: None
+    """
+    current_app.extensions["token_cache"].pop_where(lambda token, cached: cached.public_id == public_id)
+
 @user.route("/user", methods = ["GET"])
 @token_required
+@conditional(lambda current_user: USERS if current_user.admin else None)
 def get_users(current_user):
     """
-    get all users
+    get a page of all users
     :param current_user: user currently logged in
     :return: json
     """
@@ -92,18 +233,15 @@ def get_users(current_user):
     if not current_user.admin:
         return jsonify({"message": "You don't have permission to perform that function!"})
 
-    users = User.query.all()
-    output = []
+    try:
+        limit, last_id = page_args()
+    except PaginationError as e:
+        return jsonify({"message": str(e)}), 400
 
-    for user in users:
-        user_data = {}
-        user_data["public_id"] = user.public_id
-        user_data["name"] = user.name
-        user_data["password"] = user.password
-        user_data["admin"] = user.admin
-        output.append(user_data)
+    users, next_cursor = paginate(db.session.query(User.id, *USER_COLUMNS), User.id, limit, last_id)
+    output = rows_to_dicts((user[1:] for user in users), USER_KEYS)
     
-    return jsonify({"users" : output})
+    return json_response({"users" : output, "next": next_cursor})
 
 @user.route("/user/<user_id>", methods = ["GET"])
 @token_required
@@ -117,16 +255,11 @@ def get_user(current_user, user_id):
     if not current_user.admin:
         return jsonify({"message": "You don't have permission to perform that function!"})
 
-    user = User.query.filter_by(public_id=user_id).first()
+    user = db.session.query(*USER_COLUMNS).filter(User.public_id == user_id).first()
     if not user:
         return jsonify({"message": "User does not exist!"})
-    user_data = dict()
-    user_data["public_id"] = user.public_id
-    user_data["name"] = user.name
-    user_data["password"] = user.password
-    user_data["admin"] = user.admin
-    output = [user_data]
-    return jsonify({"user": output})
+    output = rows_to_dicts([user], USER_KEYS)
+    return json_response({"user": output})
 
 
 @user.route("/user/<user_id>/promote", methods=["PUT"])
@@ -147,7 +280,9 @@ def promote_user(current_user, user_id):
         return jsonify({"message": "User does not exist!"})
     
     user.admin = True
+    bump(USERS)
     db.session.commit()
+    invalidate_tokens(user_id)
     return jsonify({"message": "User has been promoted to admin!"})
 
 @user.route("/user/<user_id>/update", methods = ["PUT"])
@@ -169,9 +304,13 @@ def update_user(current_user, user_id):
 
     data = request.get_json()
     user.name = data["name"]
-    user.password= generate_password_hash(data["password"], method="sha256")
+    user.password = hash_password(data["password"])
+    # a new password ends the sessions started with the old one
+    RefreshToken.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+    bump(USERS)
 
     db.session.commit()
+    invalidate_tokens(user_id)
 
     return jsonify({"message": "User info has been updated!"})
 
@@ -187,11 +326,17 @@ def remove_user(current_user, user_id):
     if not current_user.admin:
         return jsonify({"message": "You don't have permission to perform that function!"})
     
-    user = User.query.filter_by(public_id=user_id).first()
-    if not user:
+    owner_id = db.session.query(User.id).filter_by(public_id=user_id).scalar()
+    if owner_id is None:
         return jsonify({"message": "User does not exist!"})
-    db.session.delete(user)
+
+    # one statement, the database cascades it to the todos
+    User.query.filter_by(id=owner_id).delete(synchronize_session=False)
+    bump(USERS)
+    bump(todo_key(owner_id))
     db.session.commit()
+    invalidate_tokens(user_id)
+    current_app.extensions["todo_cache"].invalidate(todo_key(owner_id))
     return jsonify({"message": "User has been deleted!"})
 
 
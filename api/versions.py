@@ -0,0 +1,66 @@
+import hashlib
+from functools import wraps
+from flask import current_app, request
+from . import db
+from .models import Version
+
+# key of the counter bumped by every change of the user table
+USERS = "user"
+
+
+def todo_key(user_id):
+    """
+    get the key of the counter bumped by every change of a user's todos
+    :param user_id: int id of the owner
+    :return: str
+    """
+    return f"todo:{user_id}"
+
+
+def bump(key):
+    """
+    increment a counter in the current transaction
+    :param key: str counter key
+    :return: None
+    """
+    updated = Version.query.filter_by(key=key).update({"value": Version.value + 1}, synchronize_session=False)
+    if not updated:
+        db.session.execute(Version.__table__.insert().values(key=key, value=1))
+
+
+def current(key):
+    """
+    read a counter
+    :param key: str counter key
+    :return: int value, 0 if never bumped
+    """
+    return db.session.query(Version.value).filter_by(key=key).scalar() or 0
+
+
+def conditional(key_for):
+    """
+    decorator answering If-None-Match from a counter before the view queries anything,
+    the weak etag combines the counter with the endpoint and the query string of the request
+    :param key_for: function taking the current user and returning the counter key, or None to skip
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(current_user, *args, **kwargs):
+            key = key_for(current_user)
+            if key is None:
+                return f(current_user, *args, **kwargs)
+
+            variant = hashlib.sha1(request.query_string).hexdigest()[:12]
+            etag = f"{key}.{request.endpoint}.{current(key)}.{variant}"
+
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(current_user, *args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            return response
+        return wrapper
+    return decorator
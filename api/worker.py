@@ -0,0 +1,222 @@
+import json
+import os
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from flask import current_app
+from sqlalchemy import and_, func, or_
+from .models import Job
+
+# what a handler gets to know about its job, progress and result are the last
+# committed values so a restarted job continues where it stopped
+JobState = namedtuple("JobState", ("id", "params", "progress", "result"))
+
+# job kind -> handler, see handler()
+HANDLERS = {}
+
+# job kind -> function freeing what a job kept between its runs, see handler()
+CLEANUPS = {}
+
+
+class JobError(Exception):
+    """
+    raised by a job handler to fail the job with a message for the client
+    """
+
+
+def handler(kind, cleanup=None):
+    """
+    decorator registering the handler of a job kind. A handler is a generator
+    taking a JobState, it makes its changes in db.session and yields
+    (progress, total, result) after every step. The step is committed together
+    with the progress before the generator resumes, so code after a yield runs
+    after the commit.
+    :param kind: str
+    :param cleanup: function taking the job params, called once the job is done or
+                    failed, not when it is interrupted and will be resumed
+    """
+    def decorator(f):
+        HANDLERS[kind] = f
+        if cleanup is not None:
+            CLEANUPS[kind] = cleanup
+        return f
+    return decorator
+
+
+class JobQueue(object):
+    """
+    run the jobs stored in the job table from a pool of worker threads
+    """
+    def __init__(self, app, db, workers, poll, lease, max_attempts):
+        """
+        :param app: application instance
+        :param db: SQLAlchemy extension
+        :param workers: int number of worker threads, 0 to only run jobs through run_pending
+        :param poll: seconds an idle worker waits before looking for jobs again
+        :param lease: seconds a running job is owned by its worker without progress
+        :param max_attempts: int number of times a job is started before it is given up
+        """
+        self.app = app
+        self.db = db
+        self.workers = workers
+        self.poll = poll
+        self.lease = timedelta(seconds=lease)
+        self.max_attempts = max_attempts
+        self._wake = Event()
+        self._pid = None
+        self._lock = Lock()
+
+    def submit(self, kind, params):
+        """
+        store a new job and wake a worker
+        :param kind: str registered job kind
+        :param params: json serializable dict passed to the handler
+        :return: str job id
+        """
+        now = datetime.utcnow()
+        job = Job(id=str(uuid.uuid4()), kind=kind, params=json.dumps(params), status="queued",
+                  progress=0, attempts=0, created=now, updated=now)
+        self.db.session.add(job)
+        self.db.session.commit()
+
+        self.start()
+        self._wake.set()
+        return job.id
+
+    def start(self):
+        """
+        start the worker threads of this process if not running yet
+        :return: None
+        """
+        if self._pid == os.getpid() or not self.workers:
+            return
+        with self._lock:
+            # threads do not survive a fork, every worker process starts its own
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                for n in range(self.workers):
+                    Thread(target=self.work, name=f"job-worker-{n}", daemon=True).start()
+
+    def work(self):
+        """
+        loop of a worker thread
+        :return: None
+        """
+        while True:
+            try:
+                with self.app.app_context():
+                    self.run_pending()
+            except Exception:
+                # the database may be busy or gone for a moment, the jobs stay stored
+                self.app.logger.exception("Job worker failed")
+            self._wake.wait(self.poll)
+            self._wake.clear()
+
+    def run_pending(self):
+        """
+        run jobs until none is left to claim, needs an app context
+        :return: int number of jobs run
+        """
+        count = 0
+        while True:
+            job_id = self.claim()
+            if job_id is None:
+                return count
+            self.execute(job_id)
+            count += 1
+
+    def claim(self):
+        """
+        take the oldest queued job, or a running job whose worker stopped renewing its lease
+        :return: str job id or None
+        """
+        session = self.db.session
+        while True:
+            now = datetime.utcnow()
+            claimable = or_(Job.status == "queued", and_(Job.status == "running", Job.lease < now))
+            job = session.query(Job.id, Job.kind, Job.params, Job.attempts).filter(claimable) \
+                .order_by(Job.created).first()
+            if job is None:
+                session.commit()
+                return None
+
+            if job.attempts >= self.max_attempts:
+                values = {"status": "failed", "error": "Job was interrupted too often!", "lease": None}
+            else:
+                values = {"status": "running", "attempts": Job.attempts + 1, "lease": now + self.lease}
+            values["updated"] = now
+            # another worker may have claimed it since the select
+            claimed = Job.query.filter(Job.id == job.id, claimable).update(values, synchronize_session=False)
+            session.commit()
+            if claimed and values["status"] == "running":
+                return job.id
+            if claimed:
+                self.cleanup(job.id, job.kind, json.loads(job.params))
+
+    def execute(self, job_id):
+        """
+        run the handler of a claimed job, committing its progress after every step
+        :param job_id: str
+        :return: None
+        """
+        session = self.db.session
+        job = Job.query.get(job_id)
+        state = JobState(job.id, json.loads(job.params), job.progress,
+                         json.loads(job.result) if job.result else None)
+        try:
+            for progress, total, result in HANDLERS[job.kind](state):
+                self.update(job_id, {"progress": progress, "total": total, "result": json.dumps(result),
+                                     "lease": datetime.utcnow() + self.lease})
+                session.commit()
+        except JobError as e:
+            session.rollback()
+            self.update(job_id, {"status": "failed", "error": str(e), "lease": None})
+        except Exception:
+            session.rollback()
+            current_app.logger.exception("Job %s failed", job_id)
+            self.update(job_id, {"status": "failed", "error": "Job failed!", "lease": None})
+        else:
+            self.update(job_id, {"status": "done", "progress": func.coalesce(Job.total, Job.progress),
+                                 "lease": None})
+        session.commit()
+        self.cleanup(job_id, job.kind, state.params)
+
+    def cleanup(self, job_id, kind, params):
+        """
+        run the cleanup of a job that is done or failed
+        :param job_id: str
+        :param kind: str job kind
+        :param params: dict params of the job
+        :return: None
+        """
+        if kind not in CLEANUPS:
+            return
+        try:
+            CLEANUPS[kind](params)
+        except Exception:
+            current_app.logger.exception("Cleanup of job %s failed", job_id)
+
+    def update(self, job_id, values):
+        """
+        change the stored state of a job in the current transaction
+        :param job_id: str
+        :param values: dict of column values
+        :return: None
+        """
+        values["updated"] = datetime.utcnow()
+        Job.query.filter_by(id=job_id).update(values, synchronize_session=False)
+
+
+def init_app(app, db):
+    """
+    attach the job queue to an app, the workers start with the first request
+    or job of a process and then resume the jobs a crash left behind
+    :param app: application instance
+    :param db: SQLAlchemy extension
+    :return: None
+    """
+    queue = app.extensions["jobs"] = JobQueue(app, db, app.config["JOB_WORKERS"], app.config["JOB_POLL"],
+                                              app.config["JOB_LEASE"], app.config["JOB_MAX_ATTEMPTS"])
+    app.before_request(queue.start)
+
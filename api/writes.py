@@ -0,0 +1,160 @@
+import os
+import queue
+import time
+from threading import Event, Lock, Thread
+from flask import current_app
+from sqlalchemy import text
+from .metrics import COUNT_BUCKETS, Histogram
+
+
+class PendingWrite(object):
+    """
+    a write waiting in the queue and, once done, its result or error
+    """
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.queued = time.perf_counter()
+        self.result = None
+        self.error = None
+        self.done = Event()
+
+
+class WriteQueue(object):
+    """
+    commit the writes of concurrent requests in batches from a single writer thread,
+    one transaction and one fsync per batch instead of one per request
+    """
+    def __init__(self, app, db, coalesce, window, max_batch):
+        """
+        :param app: application instance
+        :param db: SQLAlchemy extension
+        :param coalesce: bool, False to run and commit every write in the calling thread
+        :param window: seconds the writer waits for more writes after the first of a batch
+        :param max_batch: int maximum number of writes committed together
+        """
+        self.app = app
+        self.db = db
+        self.coalesce = coalesce
+        self.window = window
+        self.max_batch = max_batch
+        self.sqlite = db.get_engine(app).dialect.name == "sqlite"
+        self._queue = None
+        self._pid = None
+        self._lock = Lock()
+
+        self.batch_size = self.queue_wait = None
+        metrics = app.extensions.get("metrics")
+        if coalesce and metrics is not None:
+            self.batch_size = metrics.register(Histogram("write_batch_size",
+                "Writes committed per transaction by the writer thread", (), COUNT_BUCKETS))
+            self.queue_wait = metrics.register(Histogram("write_queue_wait_seconds",
+                "Time a write waited in the queue before the writer ran it"))
+
+    def submit(self, fn, *args):
+        """
+        run a write and wait until it is committed
+        :param fn: function making the changes in db.session, it must not commit
+        :return: result of fn, its exception is raised again in the caller
+        """
+        # a write inside a savepoint, such as one of an atomic batch, belongs to the caller's transaction
+        if not self.coalesce or self.db.session().in_nested_transaction():
+            result = fn(*args)
+            self.db.session.commit()
+            return result
+
+        # the request holds no transaction while it waits for the writer
+        self.db.session.rollback()
+        pending = PendingWrite(fn, args)
+        self.writer().put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def writer(self):
+        """
+        get the queue of the writer thread, starting the thread on first use in this process
+        :return: Queue
+        """
+        with self._lock:
+            # threads do not survive a fork, a worker process starts its own writer
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                Thread(target=self.run, args=(self._queue,), name="write-queue", daemon=True).start()
+            return self._queue
+
+    def run(self, pending):
+        """
+        loop of the writer thread
+        :param pending: Queue of PendingWrite
+        :return: None
+        """
+        while True:
+            batch = [pending.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(pending.get(timeout=max(deadline - time.perf_counter(), 0)))
+                except queue.Empty:
+                    break
+            self.commit(batch)
+
+    def commit(self, batch):
+        """
+        run a batch of writes in one transaction, each write in its own savepoint
+        so a failing write is rolled back alone
+        :param batch: list of PendingWrite
+        :return: None
+        """
+        session = self.db.session
+        with self.app.app_context():
+            try:
+                if self.sqlite:
+                    # pysqlite does not begin a transaction for SAVEPOINT, releasing
+                    # the first savepoint would commit on its own. IMMEDIATE takes the
+                    # write lock up front, waiting for busy_timeout like any other writer
+                    session.execute(text("BEGIN IMMEDIATE"))
+                for write in batch:
+                    if self.queue_wait is not None:
+                        self.queue_wait.observe(time.perf_counter() - write.queued)
+                    try:
+                        with session.begin_nested():
+                            write.result = write.fn(*write.args)
+                    except Exception as e:
+                        write.error = e
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                for write in batch:
+                    if write.error is None:
+                        write.error = e
+            finally:
+                session.remove()
+
+        if self.batch_size is not None:
+            self.batch_size.observe(len(batch))
+        for write in batch:
+            write.done.set()
+
+
+def init_app(app, db):
+    """
+    attach the write queue to an app
+    :param app: application instance
+    :param db: SQLAlchemy extension
+    :return: None
+    """
+    app.extensions["write_queue"] = WriteQueue(app, db, app.config["WRITE_COALESCE"],
+                                               app.config["WRITE_WINDOW"], app.config["WRITE_BATCH_MAX"])
+
+
+def write(fn, *args):
+    """
+    run the changes of a request and commit them, batched with the writes
+    of other requests when coalescing is enabled
+    :param fn: function making the changes in db.session, it must not commit
+    :return: result of fn
+    """
+    return current_app.extensions["write_queue"].submit(fn, *args)
@@ -0,0 +1,14 @@
+def register_config(name, base, path):
+    """
+    register an app config using a database file of the benchmark, without the
+    rate limits the many requests of a benchmark client would run into
+    :param name: str name passed to create_app
+    :param base: config class to extend
+    :param path: str path of the sqlite file
+    :return: str name
+    """
+    from api.config import config
+
+    config[name] = type(name, (base,), {"SQLALCHEMY_DATABASE_URI": "sqlite:///" + path,
+                                        "ADMISSION_ENABLED": False})
+    return name
@@ -0,0 +1,59 @@
+"""
+compare two result files of bench.load and fail on regressions
+
+usage: python -m bench.compare baseline.json current.json --threshold 0.2
+"""
+import argparse
+import json
+import sys
+
+
+def regressions(baseline, current, threshold):
+    """
+    find the scenarios that got slower
+    :param baseline: dict results of the reference run
+    :param current: dict results of the new run
+    :param threshold: float relative change tolerated
+    :return: list of str describing each regression
+    """
+    found = []
+    for name, before in baseline["results"].items():
+        after = current["results"].get(name)
+        if after is None:
+            continue
+        if before["throughput"] and after["throughput"] < before["throughput"] * (1 - threshold):
+            found.append(f"{name}: throughput {before['throughput']} -> {after['throughput']} req/s")
+        if before["p99_ms"] and after["p99_ms"] and after["p99_ms"] > before["p99_ms"] * (1 + threshold):
+            found.append(f"{name}: p99 {before['p99_ms']} -> {after['p99_ms']} ms")
+        if after["errors"] > before["errors"]:
+            found.append(f"{name}: errors {before['errors']} -> {after['errors']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    print(f"{'scenario':<16}{'req/s':>20}{'p99 ms':>22}")
+    for name, before in baseline["results"].items():
+        after = current["results"].get(name)
+        if after is not None:
+            print(f"{name:<16}{before['throughput']:>9} -> {after['throughput']:<8}"
+                  f"{before['p99_ms']:>10} -> {after['p99_ms']}")
+
+    found = regressions(baseline, current, args.threshold)
+    for line in found:
+        print("REGRESSION " + line)
+    sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
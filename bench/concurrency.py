@@ -0,0 +1,81 @@
+"""
+compare read/write throughput of the default and the production engine profile
+
+usage: python -m bench.concurrency --threads 16 --seconds 5
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from sqlalchemy.exc import OperationalError
+from bench import register_config
+
+
+def run(env, threads, seconds, reads_per_write, users):
+    """
+    hammer one app from several threads with a mix of writes and reads
+    :return: dict with operation and error counts
+    """
+    from api import create_app, db
+    from api.models import ToDo
+    from api.pagination import paginate
+    from bench.seed import seed
+
+    app = create_app(env)
+    seed(db.get_engine(app), users, 10)
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(n):
+        user_id = n % users + 1
+        done = {"reads": 0, "writes": 0, "errors": 0}
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                try:
+                    for _ in range(reads_per_write):
+                        paginate(ToDo.query.filter_by(user_id=user_id), ToDo.id, 100, 0)
+                        done["reads"] += 1
+                    db.session.add(ToDo(item="bench", complete=False, user_id=user_id))
+                    db.session.commit()
+                    done["writes"] += 1
+                except OperationalError:
+                    db.session.rollback()
+                    done["errors"] += 1
+            db.session.remove()
+        with lock:
+            for key, value in done.items():
+                counts[key] += value
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    db.get_engine(app).dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--reads-per-write", type=int, default=4)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    from api.config import Config, Production
+
+    tmp = tempfile.mkdtemp()
+    print(f"{'profile':<12}{'reads/s':>10}{'writes/s':>10}{'errors':>8}")
+    for name, base in (("default", Config), ("production", Production)):
+        env = register_config(f"bench-{name}", base, os.path.join(tmp, f"{name}.db"))
+        counts = run(env, args.threads, args.seconds, args.reads_per_write, args.users)
+        print(f"{name:<12}{counts['reads'] / args.seconds:>10.0f}{counts['writes'] / args.seconds:>10.0f}"
+              f"{counts['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+measure the login and todo listing queries before and after the lookup indexes
+
+usage: python -m bench.indexes --users 100000 --todos 10
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from sqlalchemy import text
+
+
+def timed(fn, repeat):
+    """
+    run a function several times
+    :param fn: function without arguments
+    :param repeat: int number of runs
+    :return: tuple of median and max duration in milliseconds
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), max(durations)
+
+
+def measure(app, name, user_id, repeat):
+    """
+    time the queries run by login and the first page of get_todos
+    :return: dict of results
+    """
+    from api.models import ToDo, User
+    from api.pagination import paginate
+
+    with app.app_context():
+        login = timed(lambda: User.query.filter_by(name=name).first(), repeat)
+        listing = timed(lambda: paginate(ToDo.query.filter_by(user_id=user_id), ToDo.id,
+                                         app.config["PAGE_SIZE"], 0), repeat)
+    return {"login": login, "list": listing}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--todos", type=int, default=10, help="todos per user")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DATABASE_URL"] = "sqlite:///" + path
+
+    from api import create_app, db
+    from api.migrations import upgrade
+    from bench.seed import seed
+
+    app = create_app("production")
+    engine = db.get_engine(app)
+
+    # start from the schema older versions created
+    with engine.begin() as conn:
+        for index in ("ix_user_name", "ix_to_do_user_id", "ix_to_do_user_id_complete"):
+            conn.execute(text(f"DROP INDEX {index}"))
+        conn.execute(text("DELETE FROM schema_version"))
+
+    start = time.perf_counter()
+    names = seed(engine, args.users, args.todos)
+    print(f"seeded {args.users} users and {args.users * args.todos} todos "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    # the last user is the worst case for a scan
+    name, user_id = names[-1], len(names)
+    before = measure(app, name, user_id, args.repeat)
+
+    start = time.perf_counter()
+    upgrade(engine)
+    print(f"migrated in {time.perf_counter() - start:.1f}s")
+    after = measure(app, name, user_id, args.repeat)
+
+    print(f"{'query':<8}{'before median/max ms':>24}{'after median/max ms':>24}")
+    for query in ("login", "list"):
+        print(f"{query:<8}{'%.3f / %.3f' % before[query]:>24}{'%.3f / %.3f' % after[query]:>24}")
+
+
+if __name__ == "__main__":
+    main()
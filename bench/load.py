@@ -0,0 +1,261 @@
+"""
+load test every endpoint on a real WSGI server and write the results as json
+
+usage: python -m bench.load --users 1000 --todos 100 --concurrency 8 --seconds 5 --output load.json
+"""
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from werkzeug.serving import make_server
+from bench import register_config
+
+PASSWORD = "password"
+
+# names of the users created by the sign-up scenario
+SIGN_UPS = itertools.count()
+
+
+def percentile(values, fraction):
+    """
+    nearest rank percentile
+    :param values: sorted list of numbers
+    :param fraction: float between 0 and 1
+    :return: number or None for no values
+    """
+    if not values:
+        return None
+    return values[max(0, min(len(values) - 1, int(round(fraction * len(values))) - 1))]
+
+
+class Session(object):
+    """
+    a seeded user with a token, some of its todo ids and throwaway rows for the
+    destructive scenarios, a list of throwaway rows is used up by popping from it
+    """
+    def __init__(self, name, public_id, token, todo_ids):
+        self.name = name
+        self.public_id = public_id
+        self.token = token
+        self.todo_ids = todo_ids
+        # todos of this user deleted by delete_todo
+        self.spare_todos = []
+        # public ids of other users, only filled for the admin
+        self.spare_users = []
+        self.doomed_users = []
+
+    def basic(self):
+        """
+        :return: dict with the http basic auth header of the login
+        """
+        credentials = b64encode(f"{self.name}:{PASSWORD}".encode("utf-8")).decode("ascii")
+        return {"Authorization": f"Basic {credentials}"}
+
+    def auth(self):
+        """
+        :return: dict with the token header
+        """
+        return {"x-access-token": self.token}
+
+
+# every scenario builds (method, path, headers, body) from a random session and the admin session
+SCENARIOS = {
+    "login": lambda s, admin: ("GET", "/api/login", s.basic(), None),
+    "list_todos": lambda s, admin: ("GET", "/api/todo", s.auth(), None),
+    "get_todo": lambda s, admin: ("GET", f"/api/todo/{random.choice(s.todo_ids)}", s.auth(), None),
+    "create_todo": lambda s, admin: ("POST", "/api/todo", s.auth(), {"item": "load test"}),
+    "complete_todo": lambda s, admin: ("PUT", f"/api/todo/{random.choice(s.todo_ids)}", s.auth(), None),
+    "delete_todo": lambda s, admin: ("DELETE", f"/api/todo/{s.spare_todos.pop()}", s.auth(), None),
+    "sign_up": lambda s, admin: ("POST", "/api/sign-up", {}, {"name": f"load{next(SIGN_UPS)}", "password": PASSWORD}),
+    "list_users": lambda s, admin: ("GET", "/api/user", admin.auth(), None),
+    "get_user": lambda s, admin: ("GET", f"/api/user/{s.public_id}", admin.auth(), None),
+    "promote_user": lambda s, admin: ("PUT", f"/api/user/{random.choice(admin.spare_users)}/promote",
+                                      admin.auth(), None),
+    "update_user": lambda s, admin: ("PUT", f"/api/user/{random.choice(admin.spare_users)}/update", admin.auth(),
+                                     {"name": "renamed", "password": PASSWORD}),
+    "delete_user": lambda s, admin: ("DELETE", f"/api/user/{admin.doomed_users.pop()}", admin.auth(), None),
+}
+
+
+def request(conn, method, path, headers, body):
+    """
+    send one request on a keep-alive connection
+    :return: int status
+    """
+    headers = dict(headers)
+    if body is not None:
+        body = json.dumps(body)
+        headers["Content-Type"] = "application/json"
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def drive(port, scenario, sessions, admin, concurrency, seconds):
+    """
+    run one scenario from several client threads
+    :return: dict of results
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        own, failed = [], 0
+        while time.perf_counter() < deadline:
+            try:
+                args = scenario(random.choice(sessions), admin)
+            except IndexError:
+                # a destructive scenario used up its throwaway rows, see --spares
+                break
+            start = time.perf_counter()
+            try:
+                status = request(conn, *args)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port)
+                status = None
+            own.append(time.perf_counter() - start)
+            if status is None or status >= 400:
+                failed += 1
+        conn.close()
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "throughput": round(len(latencies) / elapsed, 1),
+        "p50_ms": ms(percentile(latencies, 0.5)),
+        "p90_ms": ms(percentile(latencies, 0.9)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+def sessions_for(app, port, count):
+    """
+    log in some seeded users
+    :return: list of Session, the first one is the admin
+    """
+    from api.models import ToDo, User
+
+    with app.app_context():
+        users = User.query.order_by(User.id).limit(count).all()
+        sessions = [Session(user.name, user.public_id, None,
+                            [todo_id for todo_id, in ToDo.query.with_entities(ToDo.id)
+                             .filter_by(user_id=user.id).limit(100)] or [0])
+                    for user in users]
+
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    for session in sessions:
+        conn.request("GET", "/api/login", headers=session.basic())
+        session.token = json.loads(conn.getresponse().read())["token"]
+    conn.close()
+    return sessions
+
+
+def add_spares(app, sessions, count):
+    """
+    seed the throwaway users and todos the destructive scenarios use up
+    :param sessions: list of Session, the first one is the admin
+    :param count: int number of throwaway users and of throwaway todos
+    :return: None
+    """
+    from api import db
+    from api.models import User
+    from bench.seed import seed
+
+    engine = db.get_engine(app)
+    with app.app_context():
+        last_id = db.session.query(db.func.max(User.id)).scalar()
+        seed(engine, count, 0, PASSWORD)
+        public_ids = [public_id for public_id, in User.query.with_entities(User.public_id)
+                      .filter(User.id > last_id)]
+    admin = sessions[0]
+    admin.spare_users, admin.doomed_users = public_ids[::2], public_ids[1::2]
+
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        for session in sessions:
+            user_id = cursor.execute('SELECT id FROM "user" WHERE public_id = ?', (session.public_id,)).fetchone()[0]
+            first = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM to_do").fetchone()[0] + 1
+            spares = count // len(sessions)
+            cursor.executemany("INSERT INTO to_do (id, item, complete, user_id) VALUES (?, ?, 0, ?)",
+                               [(first + n, "spare", user_id) for n in range(spares)])
+            session.spare_todos = list(range(first, first + spares))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--todos", type=int, default=100, help="todos per user")
+    parser.add_argument("--sessions", type=int, default=20, help="users logged in by the clients")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5, help="duration of every scenario")
+    parser.add_argument("--spares", type=int, default=20000,
+                        help="throwaway users and todos used up by the deleting scenarios")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--env", default="production", help="config the app is based on")
+    parser.add_argument("--output", default="load.json")
+    args = parser.parse_args()
+
+    from api import create_app, db
+    from api.config import config
+    from bench.seed import seed
+
+    path = os.path.join(tempfile.mkdtemp(), "load.db")
+    app = create_app(register_config("bench-load", config[args.env], path))
+    start = time.perf_counter()
+    seed(db.get_engine(app), args.users, args.todos, PASSWORD)
+    print(f"seeded {args.users} users and {args.users * args.todos} todos in {time.perf_counter() - start:.1f}s")
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        sessions = sessions_for(app, server.server_port, args.sessions)
+        add_spares(app, sessions, args.spares)
+        results = {}
+        print(f"{'scenario':<16}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for name in args.scenarios.split(","):
+            result = results[name] = drive(server.server_port, SCENARIOS[name], sessions, sessions[0],
+                                           args.concurrency, args.seconds)
+            print(f"{name:<16}{result['throughput']:>10}{result['p50_ms']:>10}{result['p90_ms']:>10}"
+                  f"{result['p99_ms']:>10}{result['errors']:>8}")
+    finally:
+        server.shutdown()
+
+    with open(args.output, "w") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
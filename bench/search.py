@@ -0,0 +1,129 @@
+"""
+measure full text search of todos against a LIKE scan on a large table
+
+usage: python -m bench.search --users 20000 --todos 100 --heavy 200000
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+from sqlalchemy import text
+from bench import register_config
+
+SYLLABLES = ("ba", "ko", "ri", "tem", "su", "lan", "dor", "mi", "vek", "zu", "pal", "ne", "stro", "gi", "fa")
+
+
+def vocabulary(size):
+    """
+    generate distinct pseudo words, the first ones are the most frequent
+    :return: tuple of (words, cumulative zipf weights)
+    """
+    rng = random.Random(0)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    words = sorted(words, key=lambda word: rng.random())
+    return words, list(itertools.accumulate(1 / (rank + 1) for rank in range(size)))
+
+
+WORDS, WEIGHTS = vocabulary(20000)
+
+
+def item():
+    """
+    :return: str random todo item
+    """
+    return " ".join(random.choices(WORDS, cum_weights=WEIGHTS, k=random.randint(2, 6)))
+
+
+def seed_items(engine, users, todos_per_user, heavy, chunk=50000):
+    """
+    create users and todos made of random words, the triggers fill the search index,
+    the last user gets heavy todos
+    :return: None
+    """
+    from bench.seed import seed
+
+    seed(engine, users + 1, 0)
+    rows = ((item(), False, user_id) for _ in range(todos_per_user) for user_id in range(1, users + 1))
+    rows = itertools.chain(rows, ((item(), False, users + 1) for _ in range(heavy)))
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        while True:
+            batch = [row for _, row in zip(range(chunk), rows)]
+            if not batch:
+                break
+            cursor.executemany("INSERT INTO to_do (item, complete, user_id) VALUES (?, ?, ?)", batch)
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def timed(fn, repeat):
+    """
+    :return: tuple of median and max duration in milliseconds
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), max(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--todos", type=int, default=100, help="todos per user")
+    parser.add_argument("--heavy", type=int, default=200000, help="todos of one extra user")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from api import create_app, db
+    from api.config import Production
+    from api.search import search_todos
+
+    app = create_app(register_config("bench-search", Production, os.path.join(tempfile.mkdtemp(), "search.db")))
+    start = time.perf_counter()
+    seed_items(db.get_engine(app), args.users, args.todos, args.heavy)
+    print(f"seeded {args.users * args.todos + args.heavy} todos with their index "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    like = text("SELECT id, item, complete FROM to_do WHERE user_id = :user_id AND item LIKE :pattern "
+                "ORDER BY id LIMIT 101")
+
+    with app.app_context():
+        print(f"{'user':<8}{'query':<14}{'median ms':>12}{'max ms':>12}")
+        for label, user_id in (("light", args.users // 2), ("heavy", args.users + 1)):
+            common, mid, rare = WORDS[0], WORDS[100], WORDS[5000]
+            cursor = search_todos(user_id, common, 10)[1]
+            cases = {
+                "common word": lambda: search_todos(user_id, common, 100),
+                "mid word": lambda: search_todos(user_id, mid, 100),
+                "rare word": lambda: search_todos(user_id, rare, 100),
+                "two words": lambda: search_todos(user_id, f"{common} {mid}", 100),
+                "prefix": lambda: search_todos(user_id, mid[:3] + "*", 100),
+                "second page": lambda: search_todos(user_id, common, 10, decode(cursor)),
+                "LIKE common": lambda: db.session.execute(like, {"user_id": user_id, "pattern": f"%{common}%"}).all(),
+                "LIKE rare": lambda: db.session.execute(like, {"user_id": user_id, "pattern": f"%{rare}%"}).all(),
+            }
+            for name, fn in cases.items():
+                median, slowest = timed(fn, args.repeat)
+                print(f"{label:<8}{name:<14}{median:>12.3f}{slowest:>12.3f}")
+
+
+def decode(cursor):
+    """
+    :return: keyset stored in a cursor
+    """
+    from api.pagination import decode_cursor
+
+    return decode_cursor(cursor) if cursor else None
+
+
+if __name__ == "__main__":
+    main()
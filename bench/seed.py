@@ -0,0 +1,43 @@
+import uuid
+from werkzeug.security import generate_password_hash
+
+CHUNK = 50000
+
+
+def seed(engine, users, todos_per_user, password="password", complete_every=3):
+    """
+    fill the user and to_do tables with generated rows using executemany
+    :param engine: sqlalchemy engine of a database with the api schema
+    :param users: int number of users to create
+    :param todos_per_user: int number of todos created for every user
+    :param password: str password shared by every generated user
+    :param complete_every: int every n-th todo is marked complete
+    :return: list of generated user names
+    """
+    # hashing once keeps seeding fast, every user gets the same hash
+    hash_pass = generate_password_hash(password, method="sha256")
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM "user"')
+        first_id = cursor.fetchone()[0] + 1
+        names = [f"user{first_id + i}" for i in range(users)]
+
+        for start in range(0, users, CHUNK):
+            cursor.executemany(
+                'INSERT INTO "user" (id, public_id, name, password, admin) VALUES (?, ?, ?, ?, ?)',
+                [(first_id + i, str(uuid.uuid4()), names[i], hash_pass, first_id + i == 1)
+                 for i in range(start, min(start + CHUNK, users))])
+            conn.commit()
+
+        rows = ((f"todo {n} of {names[i]}", n % complete_every == 0, first_id + i)
+                for n in range(todos_per_user) for i in range(users))
+        while True:
+            chunk = [row for _, row in zip(range(CHUNK), rows)]
+            if not chunk:
+                break
+            cursor.executemany("INSERT INTO to_do (item, complete, user_id) VALUES (?, ?, ?)", chunk)
+            conn.commit()
+    finally:
+        conn.close()
+    return names
@@ -0,0 +1,92 @@
+"""
+measure the app factory startup time on a new and on an up to date database
+
+usage: python -m bench.startup --repeat 20
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from bench import register_config
+
+# run by a fresh interpreter, prints the import and create_app durations in milliseconds
+COLD = """
+import time
+start = time.perf_counter()
+from api import create_app
+imported = time.perf_counter()
+create_app("production")
+print((imported - start) * 1000, (time.perf_counter() - imported) * 1000)
+"""
+
+
+def median_max(durations):
+    """
+    :param durations: list of milliseconds
+    :return: tuple of median and max
+    """
+    return statistics.median(durations), max(durations)
+
+
+def cold(path, repeat):
+    """
+    start a new interpreter per run against the same database file
+    :return: tuple of (median, max) for the import and for create_app
+    """
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + path)
+    imports, factories = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", COLD], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        imported, created = map(float, output.split())
+        imports.append(imported)
+        factories.append(created)
+    return median_max(imports), median_max(factories)
+
+
+def warm(directory, repeat, fresh):
+    """
+    call create_app repeatedly in this process
+    :param fresh: bool, use a new database file per call instead of an up to date one
+    :return: tuple of median and max milliseconds
+    """
+    from api import create_app, db
+    from api.config import Production
+
+    durations = []
+    for n in range(repeat):
+        path = os.path.join(directory, f"fresh{n}.db" if fresh else "current.db")
+        name = register_config(f"startup{n}", Production, path)
+        start = time.perf_counter()
+        app = create_app(name)
+        durations.append((time.perf_counter() - start) * 1000)
+        db.get_engine(app).dispose()
+    return median_max(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "current.db")
+    # the first start creates and migrates the database the other runs reuse
+    imports, factories = cold(path, args.repeat)
+    results = {
+        "import (new process)": imports,
+        "create_app (new process)": factories,
+        "create_app (new database)": warm(directory, args.repeat, True),
+        "create_app (up to date)": warm(directory, args.repeat, False),
+    }
+
+    print(f"{'step':<28}{'median/max ms':>20}")
+    for step, result in results.items():
+        print(f"{step:<28}{'%.2f / %.2f' % result:>20}")
+
+
+if __name__ == "__main__":
+    main()
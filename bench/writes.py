@@ -0,0 +1,79 @@
+"""
+compare todo write throughput with and without group commit
+
+usage: python -m bench.writes --threads 16 --seconds 5
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from bench import register_config
+
+
+def run(env, threads, seconds, coalesce):
+    """
+    create and complete todos from several threads through the app
+    :return: dict with the number of writes and errors
+    """
+    from api import create_app, db
+    from api.config import config
+    from bench.seed import seed
+
+    config[env].WRITE_COALESCE = coalesce
+    app = create_app(env)
+    app.config["TESTING"] = True
+    seed(db.get_engine(app), threads, 0)
+
+    counts = {"writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(n):
+        client = app.test_client()
+        token = client.get("/api/login", auth=(f"user{n + 1}", "password")).json["token"]
+        header = {"x-access-token": token}
+        done = {"writes": 0, "errors": 0}
+        while time.perf_counter() < deadline:
+            response = client.post("/api/todo", headers=header, json={"item": "bench"})
+            done["writes" if response.status_code == 200 else "errors"] += 1
+        with lock:
+            for key, value in done.items():
+                counts[key] += value
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    metrics = app.extensions.get("metrics")
+    if coalesce and metrics is not None:
+        samples = {name: value for name, _, value in app.extensions["write_queue"].batch_size.samples()}
+        counts["mean batch"] = samples["write_batch_size_sum"] / max(samples["write_batch_size_count"], 1)
+    db.get_engine(app).dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--synchronous", default="FULL", help="sqlite synchronous pragma")
+    args = parser.parse_args()
+
+    os.environ["SQLITE_SYNCHRONOUS"] = args.synchronous
+    from api.config import Production
+
+    directory = tempfile.mkdtemp()
+    for coalesce in (False, True):
+        name = register_config(f"writes{int(coalesce)}", Production,
+                               os.path.join(directory, f"writes{int(coalesce)}.db"))
+        counts = run(name, args.threads, args.seconds, coalesce)
+        label = "group commit" if coalesce else "commit per request"
+        extra = f", {counts['mean batch']:.1f} writes per commit" if "mean batch" in counts else ""
+        print(f"{label:<20}{counts['writes'] / args.seconds:>10.0f} writes/s, {counts['errors']} errors{extra}")
+
+
+if __name__ == "__main__":
+    main()
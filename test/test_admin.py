@@ -0,0 +1,77 @@
+import json
+import unittest
+from api.models import ToDo, User
+from test.basic import Base
+
+class TestAdmin(Base):
+    """
+    test export and import of the tables
+    """
+    def test_export_users(self):
+        """
+        test exporting the user table as ndjson and csv
+        """
+        token = super().get_access_token()[0]
+
+        response = self.client.get("/api/export/user", headers={"x-access-token": token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(["user1", "user2"], [row["name"] for row in rows])
+        self.assertEqual(User.query.filter_by(name="user2").first().public_id, rows[1]["public_id"])
+
+        response = self.client.get("/api/export/user?format=csv", headers={"x-access-token": token})
+        self.assertEqual(response.mimetype, "text/csv")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(lines[0], "id,public_id,name,password,admin")
+        self.assertEqual(3, len(lines))
+
+        response = self.client.get("/api/export/password", headers={"x-access-token": token})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json["message"], "Unknown table or format!")
+
+    def test_import_todos(self):
+        """
+        test importing todos in chunks with progress lines
+        """
+        token, token2 = super().get_access_token()[:2]
+        self.app.config["IMPORT_CHUNK_SIZE"] = 2
+        body = "".join(json.dumps({"item": f"todo {i}", "user_id": 2, "complete": i == 0}) + "\n" for i in range(5))
+
+        response = self.client.post("/api/import/todo", headers={"x-access-token": token}, data=body)
+        self.assertEqual(response.status_code, 200)
+        progress = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([2, 4, 5], [line["rows"] for line in progress])
+        self.assertTrue(progress[-1]["done"])
+
+        listing = self.client.get("/api/todo", headers={"x-access-token": token2}).json["todos"]
+        self.assertEqual([f"todo {i}" for i in range(5)], [todo["item"] for todo in listing])
+        self.assertTrue(listing[0]["complete"])
+
+        body = json.dumps({"item": "todo 5", "user_id": 2}) + "\n" + "not json\n"
+        response = self.client.post("/api/import/todo", headers={"x-access-token": token}, data=body)
+        progress = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(progress[-1], {"rows": 0, "done": False, "error": "Invalid row on line 2!"})
+        self.assertEqual(5, ToDo.query.count())
+
+        # ids beyond the range packed into the search index
+        for row in ({"id": (1 << 32) + 5, "item": "todo", "user_id": 2}, {"item": "todo", "user_id": 1 << 31}):
+            response = self.client.post("/api/import/todo", headers={"x-access-token": token}, data=json.dumps(row))
+            progress = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+            self.assertEqual(progress[-1]["error"], "Invalid row on line 1!")
+        self.assertEqual(5, ToDo.query.count())
+
+    def test_unauthorized_admin(self):
+        """
+        test export and import with a non-admin user
+        """
+        token = super().get_access_token()[1]
+
+        response = self.client.get("/api/export/user", headers={"x-access-token": token})
+        self.assertEqual(response.json["message"], "You don't have permission to perform that function!")
+
+        response = self.client.post("/api/import/user", headers={"x-access-token": token}, data="")
+        self.assertEqual(response.json["message"], "You don't have permission to perform that function!")
+
+if __name__ == "__main__":
+    unittest.main()
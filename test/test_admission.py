@@ -0,0 +1,132 @@
+import unittest
+from unittest import mock
+from api import admission, batch
+from api.admission import TokenBuckets
+from test.basic import Base
+
+class TestAdmission(Base):
+    """
+    test the rate and concurrency limits of the api
+    """
+    def setUp(self):
+        """
+        enable admission control with small limits on the test app
+        """
+        super().setUp()
+        self.app.config.update(ADMISSION_ENABLED=True, RATE_LIMIT=(1, 3), LOGIN_RATE_LIMIT=(1, 4),
+                               RATE_LIMIT_KEYS=100, CONCURRENCY_LIMITS={"hash": 1, "write": 1, "read": 1})
+        admission.init_app(self.app)
+        self.limits = self.app.extensions["admission"]
+
+    def test_login_limited_per_ip(self):
+        """
+        test sign-up and login share the bucket of a client ip
+        """
+        self.sign_up("user1", "password1")
+        for _ in range(3):
+            self.assertEqual(self.login("user1", "password1").status_code, 201)
+
+        response = self.login("user1", "password1")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json["message"], "Too many requests, try again later!")
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+        # another client has its own bucket
+        response = self.client.get("/api/login", headers=self.get_header('{"name": "user1", "password": "password1"}'),
+                                   environ_base={"REMOTE_ADDR": "10.0.0.2"})
+        self.assertEqual(response.status_code, 201)
+
+    def test_limited_per_user(self):
+        """
+        test every user has a bucket of its own
+        """
+        self.limits["clients"].burst = 10
+        token1, token2, _, _ = self.get_access_token()
+        for _ in range(3):
+            self.assertEqual(self.client.get("/api/todo", headers={"x-access-token": token1}).status_code, 200)
+        self.assertEqual(self.client.get("/api/todo", headers={"x-access-token": token1}).status_code, 429)
+        self.assertEqual(self.client.get("/api/todo", headers={"x-access-token": token2}).status_code, 200)
+
+        # requests without a valid token are counted against the client ip
+        for _ in range(3):
+            self.assertEqual(self.client.get("/api/todo", headers={"x-access-token": "invalid"}).status_code, 401)
+        self.assertEqual(self.client.get("/api/todo", headers={"x-access-token": "invalid"}).status_code, 429)
+
+    def test_concurrency_limit(self):
+        """
+        test a request is rejected at once while its endpoint class is full, not the other classes
+        """
+        self.limits["clients"].burst = 10
+        token = self.get_access_token()[1]
+        self.assertTrue(self.limits["limits"]["read"].acquire())
+
+        response = self.client.get("/api/todo", headers={"x-access-token": token})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json["message"], "Server is busy, try again later!")
+        self.assertEqual(response.headers["Retry-After"], "1")
+        response = self.client.post("/api/todo", headers={"x-access-token": token}, json={"item": "milk"})
+        self.assertEqual(response.json["message"], "New todo created!")
+        self.assertEqual(self.limits["limits"]["write"].active, 0)
+
+        self.limits["limits"]["read"].release()
+        response = self.client.get("/api/todo", headers={"x-access-token": token})
+        self.assertEqual(response.status_code, 200)
+
+    def test_batch(self):
+        """
+        test a batch holds its slot while its requests run and can not run password checks
+        """
+        self.limits["clients"].burst = 10
+        token = self.get_access_token()[1]
+        write = self.limits["limits"]["write"]
+        active = []
+        real = batch.dispatch
+
+        def dispatch(entry, atomic):
+            response = real(entry, atomic)
+            active.append(write.active)
+            return response
+
+        with mock.patch("api.batch.dispatch", side_effect=dispatch):
+            response = self.client.post("/api/batch", headers={"x-access-token": token},
+                                        json=[{"method": "GET", "path": "/api/todo"}] * 2 +
+                                             [{"method": "GET", "path": "/api/login"}])
+        self.assertEqual(active, [1, 1, 1])
+        self.assertEqual(write.active, 0)
+        self.assertEqual(response.json["responses"][2],
+                         {"status": 400, "body": {"message": "Endpoint can not be batched!"}})
+
+    def test_batch_limited_per_request(self):
+        """
+        test every request of a batch takes a token of its user's bucket
+        """
+        self.limits["clients"].burst = 10
+        token = self.get_access_token()[1]
+        response = self.client.post("/api/batch", headers={"x-access-token": token},
+                                    json=[{"method": "GET", "path": "/api/todo"}] * 3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry["status"] for entry in response.json["responses"]], [200, 200, 429])
+        self.assertEqual(response.json["responses"][2],
+                         {"status": 429, "body": {"message": "Too many requests, try again later!"},
+                          "headers": {"Retry-After": "1"}})
+
+    def test_buckets(self):
+        """
+        test tokens refill over time and idle buckets are dropped
+        """
+        buckets = TokenBuckets(2, 2, 3)
+        with mock.patch("api.admission.time.monotonic", return_value=100):
+            self.assertEqual((buckets.take("a"), buckets.take("a")), (0, 0))
+            self.assertEqual(buckets.take("a"), 0.5)
+        with mock.patch("api.admission.time.monotonic", return_value=100.5):
+            self.assertEqual(buckets.take("a"), 0)
+            for key in "bcd":
+                buckets.take(key)
+            # the least recently used bucket makes room
+            self.assertEqual(len(buckets), 3)
+        with mock.patch("api.admission.time.monotonic", return_value=102):
+            buckets.take("e")
+            self.assertEqual(len(buckets), 1)
+
+if __name__ == "__main__":
+    unittest.main()
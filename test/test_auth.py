@@ -1,5 +1,12 @@
+import time
 import unittest
-from api.models import User
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+from werkzeug.security import generate_password_hash, check_password_hash
+from api import db
+from api.hashing import HashPool, HashPoolBusy
+from api.models import RefreshToken, User
 from test.basic import Base
 
 class TestAuth(Base):
@@ -51,5 +58,118 @@ class TestAuth(Base):
         self.assertEqual(response.status_code, 401)
         self.assertIn(b"Could not verify!", response.data)
 
+    def test_login_upgrades_hash(self):
+        """
+        test a hash stored with an old scheme is replaced on login
+        """
+        user = User(public_id=str(uuid.uuid4()), name="user1", admin=True,
+                    password=generate_password_hash("password", method="sha256"))
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.login("user1", "password")
+        self.assertEqual(response.status_code, 201)
+
+        user = User.query.filter_by(name="user1").first()
+        self.assertTrue(user.password.startswith(self.app.config["PASSWORD_HASH_METHOD"] + "$"))
+        self.assertTrue(check_password_hash(user.password, "password"))
+        self.assertEqual(self.login("user1", "password").status_code, 201)
+
+    def test_refresh_token(self):
+        """
+        test a refresh token is traded for new tokens without a password check
+        """
+        self.sign_up("user1", "password")
+        refresh = self.login("user1", "password").json["refresh_token"]
+
+        with mock.patch("api.user.verify_password") as verify:
+            response = self.client.post("/api/token/refresh", json={"refresh_token": refresh})
+        verify.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(response.json["refresh_token"], refresh)
+
+        response = self.client.get("/api/todo", headers={"x-access-token": response.json["token"]})
+        self.assertEqual(response.status_code, 200)
+
+    def test_refresh_token_reuse(self):
+        """
+        test a spent refresh token is rejected and revokes the tokens rotated from it
+        """
+        self.sign_up("user1", "password")
+        refresh = self.login("user1", "password").json["refresh_token"]
+        rotated = self.client.post("/api/token/refresh", json={"refresh_token": refresh}).json["refresh_token"]
+
+        response = self.client.post("/api/token/refresh", json={"refresh_token": refresh})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json["message"], "Invalid refresh token!")
+
+        response = self.client.post("/api/token/refresh", json={"refresh_token": rotated})
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_token_invalid(self):
+        """
+        test missing, unknown and expired refresh tokens
+        """
+        response = self.client.post("/api/token/refresh", json={})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json["message"], "No refresh token found!")
+
+        response = self.client.post("/api/token/refresh", json={"refresh_token": "unknown"})
+        self.assertEqual(response.status_code, 401)
+
+        self.sign_up("user1", "password")
+        refresh = self.login("user1", "password").json["refresh_token"]
+        RefreshToken.query.update({"expires": datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+        response = self.client.post("/api/token/refresh", json={"refresh_token": refresh})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json["message"], "Invalid refresh token!")
+
+    def test_hashing_busy(self):
+        """
+        test hashing routes fail fast while the hashing queue is full
+        """
+        self.sign_up("user1", "password")
+        self.app.extensions["hash_pool"] = HashPool(0, 0, 1)
+
+        response = self.sign_up("user2", "password")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], str(self.app.config["HASH_RETRY_AFTER"]))
+        self.assertEqual(response.json["message"], "Server is busy, try again later!")
+
+        response = self.login("user1", "password")
+        self.assertEqual(response.status_code, 503)
+
+    def test_hashing_timeout_keeps_slot(self):
+        """
+        test a hash given up on keeps its queue slot until it finished
+        """
+        pool = HashPool(1, 1, 60)
+        try:
+            self.assertEqual(pool.run(abs, -1), 1)
+            pool.timeout = 0.05
+            with self.assertRaises(HashPoolBusy):
+                pool.run(time.sleep, 0.5)
+            # rejected at once instead of queueing behind the abandoned hash
+            pool.timeout = 60
+            with self.assertRaises(HashPoolBusy):
+                pool.run(abs, -1)
+
+            time.sleep(0.6)
+            self.assertEqual(pool.run(abs, -1), 1)
+        finally:
+            pool.shutdown()
+
+    def test_hashing_worker_process(self):
+        """
+        test hashing in a worker process
+        """
+        pool = HashPool(1, 2, 60)
+        try:
+            pwhash = pool.run(generate_password_hash, "password", method="pbkdf2:sha256:1000")
+            self.assertTrue(pool.run(check_password_hash, pwhash, "password"))
+        finally:
+            pool.shutdown()
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
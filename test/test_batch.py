@@ -0,0 +1,118 @@
+import unittest
+from unittest import mock
+from api import user
+from api.models import ToDo
+from test.basic import Base
+
+class TestBatch(Base):
+    """
+    test running several requests through one batch request
+    """
+    def setUp(self):
+        """
+        log in and create a todo
+        """
+        super().setUp()
+        self.token = self.get_access_token()[1]
+        self.header = {"x-access-token": self.token}
+        self.client.post("/api/todo", headers=self.header, json={"item": "milk"})
+
+    def batch(self, data):
+        """
+        send a batch request
+        :return: http test response
+        """
+        return self.client.post("/api/batch", headers=self.header, json=data)
+
+    def test_batch(self):
+        """
+        test the requests of a batch are dispatched to their views with one authentication
+        """
+        with mock.patch("api.user.authenticate", wraps=user.authenticate) as authenticate:
+            response = self.batch([
+                {"method": "GET", "path": "/api/todo?limit=10"},
+                {"method": "PUT", "path": "/api/todo/1"},
+                {"method": "GET", "path": "/api/todo/1"},
+                {"method": "POST", "path": "/api/todo", "body": {"item": "tea"}},
+                {"method": "GET", "path": "/api/todo/99"},
+                {"method": "GET", "path": "/api/unknown"},
+            ])
+        self.assertEqual(authenticate.call_count, 1)
+        self.assertEqual(response.status_code, 200)
+
+        responses = response.json["responses"]
+        self.assertEqual([entry["status"] for entry in responses], [200, 200, 200, 200, 200, 404])
+        self.assertEqual(responses[0]["body"]["todos"], [{"id": 1, "item": "milk", "complete": False}])
+        self.assertIn("ETag", responses[0]["headers"])
+        self.assertEqual(responses[2]["body"]["todo"], [{"id": 1, "item": "milk", "complete": True}])
+        self.assertEqual(responses[4]["body"]["message"], "Todo does not exist!")
+        self.assertEqual(ToDo.query.count(), 2)
+
+        # conditional requests work inside a batch
+        etag = self.batch([{"method": "GET", "path": "/api/todo"}]).json["responses"][0]["headers"]["ETag"]
+        response = self.batch([{"method": "GET", "path": "/api/todo", "headers": {"If-None-Match": etag}}])
+        self.assertEqual(response.json["responses"][0]["status"], 304)
+
+        # a batch does not authenticate later requests
+        self.assertEqual(self.client.get("/api/todo").status_code, 401)
+
+    def test_atomic_batch(self):
+        """
+        test an atomic batch is rolled back when one of its requests fails
+        """
+        response = self.batch({"atomic": True, "requests": [
+            {"method": "POST", "path": "/api/todo", "body": {"item": "tea"}},
+            {"method": "PUT", "path": "/api/todo/batch", "body": {"filter": "unknown"}},
+            {"method": "POST", "path": "/api/todo", "body": {"item": "eggs"}},
+        ]})
+        self.assertFalse(response.json["committed"])
+        self.assertEqual([entry["status"] for entry in response.json["responses"]], [200, 400])
+        self.assertEqual(ToDo.query.count(), 1)
+
+        response = self.batch({"atomic": True, "requests": [
+            {"method": "POST", "path": "/api/todo", "body": {"item": "tea"}},
+            {"method": "PUT", "path": "/api/todo/1"},
+        ]})
+        self.assertTrue(response.json["committed"])
+        self.assertEqual(ToDo.query.count(), 2)
+        response = self.client.get("/api/todo/stats", headers=self.header)
+        self.assertEqual(response.json, {"total": 2, "completed": 1, "open": 1})
+
+        response = self.batch({"atomic": True, "requests": [{"method": "GET", "path": "/api/user"}]})
+        self.assertEqual(response.json["responses"][0]["body"]["message"], "Endpoint can not be batched!")
+
+    def test_atomic_idempotent_request(self):
+        """
+        test the response of an idempotent request is only replayed once its batch committed
+        """
+        keyed = {"method": "POST", "path": "/api/todo", "body": {"item": "tea"}, "headers": {"Idempotency-Key": "k1"}}
+        response = self.batch({"atomic": True, "requests": [keyed, {"method": "PUT", "path": "/api/todo/batch"}]})
+        self.assertFalse(response.json["committed"])
+        response = self.client.post("/api/todo", headers={**self.header, "Idempotency-Key": "k1"}, json={"item": "tea"})
+        self.assertNotIn("Idempotent-Replayed", response.headers)
+        self.assertEqual(ToDo.query.count(), 2)
+
+        response = self.batch({"atomic": True, "requests": [dict(keyed, headers={"Idempotency-Key": "k2"})]})
+        self.assertTrue(response.json["committed"])
+        response = self.client.post("/api/todo", headers={**self.header, "Idempotency-Key": "k2"}, json={"item": "tea"})
+        self.assertEqual(response.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(ToDo.query.count(), 3)
+
+    def test_invalid_batch(self):
+        """
+        test malformed, oversized and streaming batches
+        """
+        response = self.batch({"method": "GET", "path": "/api/todo"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json["message"], "Expected a list of requests!")
+        self.assertEqual(self.batch([{"method": "GET", "path": "/metrics"}]).status_code, 400)
+
+        self.app.config["BATCH_MAX"] = 1
+        response = self.batch([{"method": "GET", "path": "/api/todo"}] * 2)
+        self.assertEqual(response.status_code, 413)
+
+        response = self.batch([{"method": "GET", "path": "/api/todo/changes"}])
+        self.assertEqual(response.json["responses"][0]["status"], 400)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from base64 import b64encode
+from api import create_app, db
+from api.cache import MemoryBackend, ReadCache, SharedBackend, TTLCache
+from api.config import Testing, config
+
+class FakeRedis(object):
+    """
+    local stand-in for the part of the redis client used by SharedBackend
+    """
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode("utf-8")
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+class TestTTLCache(unittest.TestCase):
+    """
+    test the in-process cache
+    """
+    def test_lru_eviction(self):
+        """
+        test the least recently used entry is evicted once full
+        """
+        cache = TTLCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_expiry(self):
+        """
+        test entries are dropped after their time to live
+        """
+        cache = TTLCache(10, ttl=60)
+        cache.set("a", 1, ttl=0.01)
+        cache.set("b", 2)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+
+    def test_pop_where(self):
+        """
+        test removing entries matching a predicate
+        """
+        cache = TTLCache(10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("c", 3)
+
+        self.assertEqual(cache.pop_where(lambda key, value: value % 2 == 1), 2)
+        self.assertEqual(cache.pop("b"), 2)
+        self.assertEqual(len(cache), 0)
+
+class TestReadCache(unittest.TestCase):
+    """
+    test the read-through cache on both backends
+    """
+    def check_backend(self, backend):
+        """
+        run the read cache checks against one backend
+        :param backend: cache backend
+        """
+        cache = ReadCache(backend, 60)
+        loads = []
+
+        def load(value):
+            loads.append(value)
+            return {"value": value}
+
+        self.assertEqual(cache.get_or_set("todo:1", "list", lambda: load(1)), {"value": 1})
+        self.assertEqual(cache.get_or_set("todo:1", "list", lambda: load(2)), {"value": 1})
+        self.assertEqual(cache.get_or_set("todo:2", "list", lambda: load(3)), {"value": 3})
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 2})
+
+        # only the invalidated namespace is reloaded
+        cache.invalidate("todo:1")
+        self.assertEqual(cache.get_or_set("todo:1", "list", lambda: load(4)), {"value": 4})
+        self.assertEqual(cache.get_or_set("todo:2", "list", lambda: load(5)), {"value": 3})
+        self.assertEqual(loads, [1, 3, 4])
+
+        # misses loading nothing are not stored
+        self.assertIsNone(cache.get_or_set("todo:1", "item", lambda: None))
+        self.assertEqual(cache.get_or_set("todo:1", "item", lambda: load(6)), {"value": 6})
+
+    def test_memory_backend(self):
+        """
+        test the in-process backend
+        """
+        self.check_backend(MemoryBackend(100))
+
+    def test_shared_backend(self):
+        """
+        test the shared backend with a local fake client
+        """
+        self.check_backend(SharedBackend(FakeRedis()))
+
+class TestTodoCacheAcrossWorkers(unittest.TestCase):
+    """
+    test the todo reads cached by one worker process follow the writes of another
+    """
+    def setUp(self):
+        """
+        create two apps sharing a database file, each with its own memory cache
+        """
+        path = os.path.join(tempfile.mkdtemp(), "test.db")
+        config["workers"] = type("workers", (Testing,), {"SQLALCHEMY_DATABASE_URI": "sqlite:///" + path})
+        self.addCleanup(config.pop, "workers")
+        self.first, self.second = create_app("workers"), create_app("workers")
+        for app in (self.first, self.second):
+            self.addCleanup(lambda app=app: db.get_engine(app).dispose())
+
+        payload = json.dumps({"name": "user1", "password": "password1"})
+        header = {"Authorization": "Basic " + b64encode(b"user1:password1").decode("utf-8"),
+                  "Content-Type": "application/json"}
+        self.first.test_client().post("/api/sign-up", headers=header, data=payload)
+        token = self.first.test_client().get("/api/login", headers=header, data=payload).json["token"]
+        self.header = {"x-access-token": token}
+
+    def test_write_of_other_worker(self):
+        """
+        test a listing cached before another worker's write is not served with the new etag
+        """
+        client = self.first.test_client()
+        self.assertEqual(client.get("/api/todo", headers=self.header).json["todos"], [])
+        self.assertEqual(client.get("/api/todo/stats", headers=self.header).json["total"], 0)
+
+        self.second.test_client().post("/api/todo", headers=self.header, json={"item": "milk"})
+
+        response = client.get("/api/todo", headers=self.header)
+        self.assertEqual([todo["item"] for todo in response.json["todos"]], ["milk"])
+        self.assertEqual(client.get("/api/todo/stats", headers=self.header).json["total"], 1)
+        self.assertEqual(client.get("/api/todo/1", headers=self.header).json["todo"][0]["item"], "milk")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import json
+import unittest
+from datetime import datetime, timedelta
+from api import db
+from api.models import Change
+from test.basic import Base
+
+class TestChanges(Base):
+    """
+    test the server-sent events of the todo change feed
+    """
+    def setUp(self):
+        """
+        log in two users, the feed is polled by the test
+        """
+        super().setUp()
+        self.token1, self.token2, _, _ = self.get_access_token()
+        self.feed = self.app.extensions["change_feed"]
+        self.feed.keepalive = 0.01
+
+    def stream(self, token, last_event_id=None):
+        """
+        open the change feed
+        :return: iterator of the str chunks of the stream
+        """
+        headers = {"x-access-token": token}
+        if last_event_id is not None:
+            headers["Last-Event-ID"] = last_event_id
+        response = self.client.get("/api/todo/changes", headers=headers, buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        chunks = (chunk.decode() for chunk in response.iter_encoded())
+        self.assertTrue(next(chunks).startswith("retry:"))
+        return chunks
+
+    def events(self, chunks, count):
+        """
+        read events from a stream, skipping keepalive comments
+        :return: list of (id, event, data)
+        """
+        events = []
+        for chunk in chunks:
+            if chunk.startswith(":"):
+                continue
+            fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+            fields.setdefault("data", "{}")
+            events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+            if len(events) == count:
+                return events
+        self.fail("stream ended")
+
+    def test_resume_from_last_event_id(self):
+        """
+        test a reconnecting client gets the changes after its last event
+        """
+        header = {"x-access-token": self.token2}
+        self.client.post("/api/todo", headers=header, json={"item": "milk"})
+        self.client.post("/api/todo/batch", headers=header, json=[{"item": "eggs"}, {"item": "tea"}])
+        self.client.put("/api/todo/1", headers=header)
+        self.client.put("/api/todo/batch", headers=header, json={"filter": "open"})
+        self.client.delete("/api/todo/batch", headers=header, json={"ids": [2]})
+        self.client.delete("/api/todo/3", headers=header)
+
+        events = self.events(self.stream(self.token2, "0"), 6)
+        self.assertEqual([(event, data) for _, event, data in events], [
+            ("create", {"todos": [{"id": 1, "item": "milk", "complete": False}]}),
+            ("create", {"todos": [{"id": 2, "item": "eggs", "complete": False},
+                                  {"id": 3, "item": "tea", "complete": False}]}),
+            ("complete", {"ids": [1]}),
+            ("complete", {"filter": "open"}),
+            ("delete", {"ids": [2]}),
+            ("delete", {"ids": [3]}),
+        ])
+        ids = [change_id for change_id, _, _ in events]
+        self.assertEqual(ids, sorted(ids))
+
+        events = self.events(self.stream(self.token2, str(ids[3])), 2)
+        self.assertEqual([change_id for change_id, _, _ in events], ids[4:])
+
+    def test_live_changes_of_the_caller(self):
+        """
+        test a stream only gets the live changes of its own user
+        """
+        chunks1 = self.stream(self.token1)
+        chunks2 = self.stream(self.token2)
+        self.client.post("/api/todo", headers={"x-access-token": self.token1}, json={"item": "milk"})
+        self.client.post("/api/todo", headers={"x-access-token": self.token2}, json={"item": "tea"})
+        self.assertEqual(self.feed.poll(), 2)
+
+        self.assertEqual(self.events(chunks2, 1)[0][2]["todos"][0]["item"], "tea")
+        self.assertEqual(self.events(chunks1, 1)[0][2]["todos"][0]["item"], "milk")
+        self.assertEqual(next(chunks2), ": keepalive\n\n")
+
+    def test_slow_stream_is_closed(self):
+        """
+        test a stream whose queue overflows ends so the client resumes from the log
+        """
+        self.feed.queue_size = 1
+        chunks = self.stream(self.token2)
+        header = {"x-access-token": self.token2}
+        self.client.post("/api/todo", headers=header, json={"item": "milk"})
+        self.client.post("/api/todo", headers=header, json={"item": "tea"})
+        self.feed.poll()
+
+        self.assertEqual(len(self.events(chunks, 1)), 1)
+        self.assertEqual(list(chunks), [])
+
+    def test_prune_and_resync(self):
+        """
+        test old changes are pruned and a client resuming before them is told to resync
+        """
+        header = {"x-access-token": self.token2}
+        for item in ("milk", "eggs", "tea"):
+            self.client.post("/api/todo", headers=header, json={"item": item})
+        ids = [change_id for change_id, in db.session.query(Change.id).order_by(Change.id)]
+        Change.query.filter(Change.id <= ids[1]).update({"created": datetime.utcnow() - timedelta(days=8)})
+        db.session.commit()
+
+        self.assertEqual(self.feed.prune(), 2)
+        self.assertEqual(self.feed.prune(), 0)
+        self.assertEqual(self.feed.pruned(), ids[1])
+        self.assertEqual([change_id for change_id, in db.session.query(Change.id)], ids[2:])
+
+        # the history after the watermark is complete
+        events = self.events(self.stream(self.token2, str(ids[1])), 1)
+        self.assertEqual(events[0][0], ids[2])
+
+        chunks = self.stream(self.token2, str(ids[0]))
+        self.assertEqual(self.events(chunks, 1), [(ids[2], "resync", {})])
+        self.client.post("/api/todo", headers=header, json={"item": "bread"})
+        self.feed.poll()
+        self.assertEqual(self.events(chunks, 1)[0][2]["todos"][0]["item"], "bread")
+
+    def test_invalid_last_event_id(self):
+        """
+        test a malformed Last-Event-ID is rejected
+        """
+        for last_event_id in ("abc", str(10 ** 30), "\u00b2"):
+            response = self.client.get("/api/todo/changes", headers={"x-access-token": self.token2,
+                                                                     "Last-Event-ID": last_event_id})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json["message"], "Invalid event id!")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import gzip
+import json
+import unittest
+import zlib
+from test.basic import Base
+
+class TestCompress(Base):
+    """
+    test response compression
+    """
+    def setUp(self):
+        super().setUp()
+        self.token = super().get_access_token()[0]
+        items = [{"item": f"todo number {i}"} for i in range(200)]
+        self.client.post("/api/todo/batch", data=json.dumps(items),
+            headers={"Content-Type": "application/json", "x-access-token": self.token})
+
+    def test_compressed_listing(self):
+        """
+        test large bodies are gzipped and the compressed form is cached by etag
+        """
+        header = {"x-access-token": self.token, "Accept-Encoding": "gzip"}
+        response = self.client.get("/api/todo?limit=200", headers=header)
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual(200, len(json.loads(gzip.decompress(response.data))["todos"]))
+
+        cache = self.app.extensions["compress_cache"]
+        self.assertEqual(cache.get(("/api/todo", response.headers["ETag"], "gzip")), response.data)
+        self.assertEqual(self.client.get("/api/todo?limit=200", headers=header).data, response.data)
+
+    def test_not_compressed(self):
+        """
+        test small bodies and clients without gzip get plain responses
+        """
+        response = self.client.get("/api/todo?limit=200", headers={"x-access-token": self.token})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(200, len(response.json["todos"]))
+
+        response = self.client.get("/api/todo", headers={"x-access-token": self.token,
+                                                         "Accept-Encoding": "gzip;q=0, identity"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+        response = self.client.get("/api/todo/stats", headers={"x-access-token": self.token,
+                                                               "Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(200, response.json["total"])
+
+    def test_compressed_stream(self):
+        """
+        test streamed bodies are compressed chunk by chunk
+        """
+        self.app.config["EXPORT_CHUNK_SIZE"] = 50
+        response = self.client.get("/api/export/todo", headers={"x-access-token": self.token,
+                                                                "Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", response.headers)
+
+        lines = zlib.decompress(response.data, 31).decode("utf-8").splitlines()
+        self.assertEqual(200, len(lines))
+        self.assertEqual("todo number 199", json.loads(lines[-1])["item"])
+
+if __name__ == "__main__":
+    unittest.main()
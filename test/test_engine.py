@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+from api import engine
+from api.config import Production
+
+class TestEngine(unittest.TestCase):
+    """
+    test the production engine profile on a database file
+    """
+    def setUp(self):
+        """
+        create an app using the production engine settings on a temporary file
+        """
+        self.tmp = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config.from_object(Production)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(self.tmp, "test.db")
+        self.db = SQLAlchemy(self.app)
+        engine.init_app(self.app, self.db)
+        self.engine = self.db.get_engine(self.app)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmp)
+
+    def test_pragmas(self):
+        """
+        test the pragmas are applied on connect
+        """
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text("PRAGMA journal_mode")).scalar(), "wal")
+            self.assertEqual(conn.execute(text("PRAGMA synchronous")).scalar(), 1)
+            self.assertEqual(conn.execute(text("PRAGMA busy_timeout")).scalar(),
+                             Production.SQLITE_PRAGMAS["busy_timeout"])
+
+        self.assertEqual(self.engine.pool.size(), Production.SQLALCHEMY_ENGINE_OPTIONS["pool_size"])
+
+    def test_connection_from_parent_process(self):
+        """
+        test a pooled connection opened by another process is replaced on checkout
+        """
+        raw = self.engine.raw_connection()
+        parent = raw.dbapi_connection
+        raw._connection_record.info["pid"] = -1
+        raw.close()
+
+        raw = self.engine.raw_connection()
+        self.assertIsNot(raw.dbapi_connection, parent)
+        self.assertEqual(raw._connection_record.info["pid"], os.getpid())
+        raw.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import time
+import unittest
+from threading import Thread
+from unittest import mock
+from api import todo, user
+from api.hashing import HashPool
+from api.models import ToDo, User
+from test.basic import Base
+
+class TestIdempotency(Base):
+    """
+    test requests retried with an Idempotency-Key
+    """
+    def setUp(self):
+        """
+        log in two users
+        """
+        super().setUp()
+        self.token1, self.token2, _, _ = self.get_access_token()
+
+    def create_todo(self, token, item, key):
+        """
+        create a todo with an idempotency key
+        :return: http test response
+        """
+        return self.client.post("/api/todo", headers={"x-access-token": token, "Idempotency-Key": key},
+                                json={"item": item})
+
+    def test_retried_todo(self):
+        """
+        test a retry replays the first response instead of creating the todo again
+        """
+        first = self.create_todo(self.token2, "milk", "key-1")
+        retry = self.create_todo(self.token2, "milk", "key-1")
+        self.assertEqual(ToDo.query.count(), 1)
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry.json, first.json)
+        self.assertEqual(retry.headers["Idempotent-Replayed"], "true")
+        self.assertNotIn("Idempotent-Replayed", first.headers)
+
+        # keys are scoped to the user
+        self.create_todo(self.token1, "milk", "key-1")
+        self.assertEqual(ToDo.query.count(), 2)
+
+        response = self.create_todo(self.token2, "tea", "key-1")
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json["message"], "Idempotency key was used for another request!")
+
+        self.assertEqual(self.create_todo(self.token2, "tea", "").status_code, 400)
+
+    def test_concurrent_duplicates(self):
+        """
+        test a duplicate sent while the first request runs waits for its response
+        """
+        # cache the token so the threads only meet in the view
+        self.client.get("/api/todo", headers={"x-access-token": self.token2})
+        write = todo.write
+
+        def slow_write(*args):
+            time.sleep(0.2)
+            return write(*args)
+
+        responses = []
+        with mock.patch("api.todo.write", side_effect=slow_write) as patched:
+            threads = [Thread(target=lambda: responses.append(self.create_todo(self.token2, "milk", "key-1")))
+                       for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(patched.call_count, 1)
+        self.assertEqual(ToDo.query.count(), 1)
+        self.assertEqual(sorted("Idempotent-Replayed" in response.headers for response in responses), [False, True])
+
+    def test_retried_sign_up(self):
+        """
+        test a retried sign-up does not hash the password again and failures are not stored
+        """
+        headers = {"Idempotency-Key": "sign-up-1"}
+        pool = self.app.extensions["hash_pool"]
+        self.app.extensions["hash_pool"] = HashPool(0, 0, 1)
+        response = self.client.post("/api/sign-up", headers=headers, json={"name": "user3", "password": "secret"})
+        self.assertEqual(response.status_code, 503)
+
+        self.app.extensions["hash_pool"] = pool
+        with mock.patch("api.user.hash_password", wraps=user.hash_password) as hash_password:
+            for _ in range(2):
+                response = self.client.post("/api/sign-up", headers=headers, json={"name": "user3", "password": "secret"})
+                self.assertEqual(response.json["message"], "New user has been created!")
+        self.assertEqual(hash_password.call_count, 1)
+        self.assertEqual(User.query.filter_by(name="user3").count(), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from sqlalchemy.exc import OperationalError
+from api import db
+from api.models import Job, ToDo, User
+from test.basic import Base
+
+class TestJobs(Base):
+    """
+    test the background jobs, run in the test with run_pending
+    """
+    def setUp(self):
+        """
+        create an admin and a user with a few todos
+        """
+        super().setUp()
+        self.app.config["JOB_CHUNK_SIZE"] = 2
+        self.app.config["IMPORT_CHUNK_SIZE"] = 2
+        self.app.config["JOB_SPOOL_DIR"] = self.spool = tempfile.mkdtemp()
+        self.admin, self.token, _, self.public_id = self.get_access_token()
+        self.client.post("/api/todo/batch", headers={"x-access-token": self.token},
+                         json=[{"item": f"todo {n}"} for n in range(5)])
+        self.queue = self.app.extensions["jobs"]
+
+    def job(self, job_id):
+        """
+        get the status of a job
+        :return: dict
+        """
+        return self.client.get(f"/api/jobs/{job_id}", headers={"x-access-token": self.admin}).json["job"]
+
+    def test_remove_user_job(self):
+        """
+        test a user is deleted by a job reporting its progress
+        """
+        response = self.client.post(f"/api/jobs/remove-user/{self.public_id}", headers={"x-access-token": self.admin})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json["job"]
+        self.assertTrue(response.headers["Location"].endswith(f"/api/jobs/{job_id}"))
+        self.assertEqual(self.job(job_id)["status"], "queued")
+
+        self.assertEqual(self.queue.run_pending(), 1)
+        job = self.job(job_id)
+        self.assertEqual((job["status"], job["progress"], job["total"]), ("done", 5, 5))
+        self.assertEqual(job["result"], {"message": "User has been deleted!"})
+        self.assertIsNone(User.query.filter_by(public_id=self.public_id).first())
+        self.assertEqual(ToDo.query.count(), 0)
+
+        response = self.client.get("/api/todo", headers={"x-access-token": self.token})
+        self.assertEqual(response.status_code, 401)
+
+    def test_import_job(self):
+        """
+        test an import job keeps the committed chunks and fails on an invalid line
+        """
+        user_id = User.query.filter_by(public_id=self.public_id).first().id
+        lines = [json.dumps({"item": "a", "user_id": user_id}), json.dumps({"item": "b", "user_id": user_id}),
+                 "", "not json"]
+        response = self.client.post("/api/jobs/import/todo", headers={"x-access-token": self.admin},
+                                    data="\n".join(lines))
+        self.assertEqual(response.status_code, 202)
+        # the upload is spooled to a file instead of being stored in the job
+        self.assertEqual(len(os.listdir(self.spool)), 1)
+
+        self.queue.run_pending()
+        job = self.job(response.json["job"])
+        # progress is the byte offset after the committed chunk
+        self.assertEqual((job["status"], job["progress"], job["error"]),
+                         ("failed", len(lines[0]) + len(lines[1]) + 2, "Invalid row on line 4!"))
+        self.assertEqual(job["result"], {"rows": 2, "lines": 2})
+        self.assertEqual(ToDo.query.filter_by(user_id=user_id).count(), 7)
+        self.assertEqual(os.listdir(self.spool), [])
+
+    def test_job_resumes_after_crash(self):
+        """
+        test a job whose worker died is claimed again once its lease expired
+        """
+        user_id = User.query.filter_by(public_id=self.public_id).first().id
+        lines = [json.dumps({"item": str(n), "user_id": user_id}) for n in range(4)]
+        job_id = self.client.post("/api/jobs/import/todo", headers={"x-access-token": self.admin},
+                                  data="\n".join(lines)).json["job"]
+
+        # a worker claimed the job, committed the first chunk and died
+        self.assertEqual(self.queue.claim(), job_id)
+        self.assertIsNone(self.queue.claim())
+        Job.query.filter_by(id=job_id).update({"progress": len(lines[0]) + len(lines[1]) + 2,
+                                               "result": json.dumps({"rows": 2, "lines": 2}),
+                                               "lease": datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+
+        self.assertEqual(self.queue.run_pending(), 1)
+        job = self.job(job_id)
+        self.assertEqual((job["status"], job["attempts"], job["result"]), ("done", 2, {"rows": 4, "lines": 4}))
+        items = [item for item, in db.session.query(ToDo.item).filter_by(user_id=user_id).order_by(ToDo.id)]
+        self.assertEqual(items[5:], ["2", "3"])
+
+    def test_job_interrupted_too_often(self):
+        """
+        test a job is given up after too many attempts
+        """
+        job_id = self.client.post("/api/jobs/import/todo", headers={"x-access-token": self.admin},
+                                  data="").json["job"]
+        Job.query.filter_by(id=job_id).update({"status": "running", "attempts": 3,
+                                               "lease": datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+
+        self.assertEqual(self.queue.run_pending(), 0)
+        job = self.job(job_id)
+        self.assertEqual((job["status"], job["error"]), ("failed", "Job was interrupted too often!"))
+        self.assertEqual(os.listdir(self.spool), [])
+
+    def test_failed_job_removes_upload(self):
+        """
+        test the upload of an import job failing on an unexpected error is removed
+        """
+        user_id = User.query.filter_by(public_id=self.public_id).first().id
+        job_id = self.client.post("/api/jobs/import/todo", headers={"x-access-token": self.admin},
+                                  data=json.dumps({"item": "a", "user_id": user_id})).json["job"]
+
+        with mock.patch("api.jobs.insert_rows", side_effect=OperationalError("INSERT", {}, Exception("locked"))), \
+                mock.patch.object(self.app.logger, "exception"):
+            self.queue.run_pending()
+        self.assertEqual((self.job(job_id)["status"], self.job(job_id)["error"]), ("failed", "Job failed!"))
+        self.assertEqual(os.listdir(self.spool), [])
+
+    def test_job_permissions(self):
+        """
+        test only admins start and read jobs
+        """
+        response = self.client.post(f"/api/jobs/remove-user/{self.public_id}", headers={"x-access-token": self.token})
+        self.assertEqual(response.json["message"], "You don't have permission to perform that function!")
+        response = self.client.get("/api/jobs/unknown", headers={"x-access-token": self.token})
+        self.assertEqual(response.json["message"], "You don't have permission to perform that function!")
+
+        response = self.client.get("/api/jobs/unknown", headers={"x-access-token": self.admin})
+        self.assertEqual(response.json["message"], "Job does not exist!")
+        response = self.client.post("/api/jobs/remove-user/unknown", headers={"x-access-token": self.admin})
+        self.assertEqual(response.json["message"], "User does not exist!")
+
+if __name__ == "__main__":
+    unittest.main()
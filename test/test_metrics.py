@@ -0,0 +1,57 @@
+import unittest
+from api.metrics import Histogram
+from test.basic import Base
+
+class TestMetrics(Base):
+    """
+    test the request, sql and hashing metrics
+    """
+    def sample(self, text, line_start):
+        """
+        get the value of the first sample starting with a prefix
+        :return: float
+        """
+        for line in text.splitlines():
+            if line.startswith(line_start):
+                return float(line.rsplit(" ", 1)[1])
+        self.fail(f"no sample {line_start}")
+
+    def test_metrics_endpoint(self):
+        """
+        test the exported metrics after a few requests
+        """
+        token = super().get_access_token()[1]
+        self.client.get("/api/todo", headers={"x-access-token": token})
+        self.client.get("/api/todo", headers={"x-access-token": token})
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        text = response.get_data(as_text=True)
+
+        self.assertEqual(self.sample(text,
+            'http_request_duration_seconds_count{endpoint="todo.get_todos",method="GET",status="200"}'), 2)
+        self.assertEqual(self.sample(text, 'http_request_duration_seconds_count{endpoint="user.login"'), 2)
+        self.assertGreater(self.sample(text, 'http_request_sql_statements_sum{endpoint="todo.get_todos"}'), 0)
+        self.assertEqual(self.sample(text, 'password_hash_duration_seconds_count{operation="generate"}'), 2)
+        self.assertEqual(self.sample(text, 'password_hash_duration_seconds_count{operation="check"}'), 2)
+        self.assertEqual(self.sample(text, 'todo_cache_requests_total{result="hit"}'), 1)
+
+    def test_histogram_buckets(self):
+        """
+        test histogram buckets are cumulative
+        """
+        histogram = Histogram("duration", "test", ("endpoint",), (0.1, 1))
+        histogram.observe(0.05, "a")
+        histogram.observe(0.5, "a")
+        histogram.observe(5, "a")
+
+        samples = {name + labels: value for name, labels, value in histogram.samples()}
+        self.assertEqual(samples['duration_bucket{endpoint="a",le="0.1"}'], 1)
+        self.assertEqual(samples['duration_bucket{endpoint="a",le="1"}'], 2)
+        self.assertEqual(samples['duration_bucket{endpoint="a",le="+Inf"}'], 3)
+        self.assertEqual(samples['duration_count{endpoint="a"}'], 3)
+        self.assertAlmostEqual(samples['duration_sum{endpoint="a"}'], 5.55)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import os
+import tempfile
+import unittest
+from threading import Barrier, Thread
+from unittest import mock
+from sqlalchemy import create_engine, inspect, text
+from api import create_app, db
+from api.config import Testing, config
+from api.migrations import HEAD, current_version, stored_version, upgrade
+
+# schema of a database created before the migrations were introduced
+OLD_SCHEMA = [
+    'CREATE TABLE "user" (id INTEGER PRIMARY KEY, public_id VARCHAR(100) NOT NULL UNIQUE, '
+    'name VARCHAR(50) NOT NULL, password VARCHAR(100) NOT NULL, admin BOOLEAN NOT NULL)',
+    "CREATE TABLE to_do (id INTEGER PRIMARY KEY, item VARCHAR(50) NOT NULL, complete BOOLEAN NOT NULL, "
+    'user_id INTEGER NOT NULL REFERENCES "user" (id))',
+]
+
+class TestMigrations(unittest.TestCase):
+    """
+    test the schema migrations
+    """
+    def setUp(self):
+        """
+        create a database with the schema of older versions
+        """
+        self.engine = create_engine("sqlite://")
+        with self.engine.begin() as conn:
+            for statement in OLD_SCHEMA:
+                conn.execute(text(statement))
+
+    def test_upgrade_old_database(self):
+        """
+        test an existing database gets the lookup indexes without being recreated
+        """
+        with self.engine.begin() as conn:
+            conn.execute(text("INSERT INTO \"user\" VALUES (1, 'abc', 'user1', 'hash', 1)"))
+
+        applied = upgrade(self.engine)
+        self.assertEqual(applied, list(range(1, HEAD + 1)))
+
+        indexes = {index["name"] for index in inspect(self.engine).get_indexes("to_do")}
+        self.assertIn("ix_to_do_user_id", indexes)
+        self.assertIn("ix_to_do_user_id_complete", indexes)
+        self.assertIn("ix_user_name", {index["name"] for index in inspect(self.engine).get_indexes("user")})
+
+        with self.engine.connect() as conn:
+            self.assertEqual(current_version(conn), HEAD)
+            self.assertEqual(conn.execute(text('SELECT name FROM "user"')).scalar(), "user1")
+
+    def test_upgrade_cascades_todos(self):
+        """
+        test the todo foreign key is rebuilt with ON DELETE CASCADE
+        """
+        with self.engine.begin() as conn:
+            conn.execute(text("INSERT INTO \"user\" VALUES (1, 'abc', 'user1', 'hash', 1)"))
+            conn.execute(text("INSERT INTO to_do VALUES (1, 'mine', 0, 1), (2, 'orphan', 0, 7)"))
+
+        upgrade(self.engine)
+        foreign_keys = inspect(self.engine).get_foreign_keys("to_do")
+        self.assertEqual(foreign_keys[0]["options"].get("ondelete"), "CASCADE")
+
+        with self.engine.begin() as conn:
+            self.assertEqual(conn.execute(text("SELECT item FROM to_do")).scalars().all(), ["mine"])
+            conn.execute(text("PRAGMA foreign_keys=ON"))
+            conn.execute(text('DELETE FROM "user"'))
+            self.assertEqual(conn.execute(text("SELECT COUNT(*) FROM to_do")).scalar(), 0)
+
+    def test_change_log_timestamps(self):
+        """
+        test a change log created without timestamps gets the column
+        """
+        upgrade(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM schema_version WHERE version >= 8"))
+            conn.execute(text("ALTER TABLE change DROP COLUMN created"))
+
+        self.assertEqual(upgrade(self.engine), [8, 9])
+        self.assertIn("created", {column["name"] for column in inspect(self.engine).get_columns("change")})
+
+    def test_drop_job_payloads(self):
+        """
+        test the payload column of a job table created before uploads were spooled is dropped
+        """
+        upgrade(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM schema_version WHERE version = 9"))
+            conn.execute(text("ALTER TABLE job ADD COLUMN payload TEXT"))
+
+        self.assertEqual(upgrade(self.engine), [9])
+        self.assertNotIn("payload", {column["name"] for column in inspect(self.engine).get_columns("job")})
+
+    def test_rerun_search_index(self):
+        """
+        test the search index is rebuilt when its step runs again on an indexed database
+        """
+        with self.engine.begin() as conn:
+            conn.execute(text("INSERT INTO \"user\" VALUES (1, 'abc', 'user1', 'hash', 1)"))
+            conn.execute(text("INSERT INTO to_do VALUES (1, 'buy milk', 0, 1)"))
+        upgrade(self.engine)
+
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM schema_version"))
+        self.assertEqual(upgrade(self.engine), list(range(1, HEAD + 1)))
+        with self.engine.connect() as conn:
+            hits = conn.execute(text("SELECT rowid FROM to_do_fts WHERE to_do_fts MATCH 'milk'")).scalars().all()
+        self.assertEqual(hits, [(1 << 32) + 1])
+
+    def test_upgrade_is_idempotent(self):
+        """
+        test an up to date database is left alone
+        """
+        upgrade(self.engine)
+        self.assertEqual(upgrade(self.engine), [])
+
+    def test_concurrent_upgrades(self):
+        """
+        test processes upgrading the same database at once apply every step once
+        """
+        path = os.path.join(tempfile.mkdtemp(), "test.db")
+        engine = create_engine("sqlite:///" + path)
+        with engine.begin() as conn:
+            for statement in OLD_SCHEMA:
+                conn.execute(text(statement))
+
+        barrier, results = Barrier(4), []
+
+        def run():
+            worker = create_engine("sqlite:///" + path, connect_args={"timeout": 30})
+            barrier.wait()
+            results.append(upgrade(worker))
+            worker.dispose()
+
+        threads = [Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(step for applied in results for step in applied), list(range(1, HEAD + 1)))
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute(text("SELECT version FROM schema_version ORDER BY version")).scalars().all(),
+                             list(range(1, HEAD + 1)))
+        engine.dispose()
+
+    def test_stored_version(self):
+        """
+        test the version is read without creating the version table
+        """
+        self.assertIsNone(stored_version(self.engine))
+        self.assertNotIn("schema_version", inspect(self.engine).get_table_names())
+
+        upgrade(self.engine)
+        self.assertEqual(stored_version(self.engine), HEAD)
+
+    def test_startup_skips_current_database(self):
+        """
+        test create_app only creates tables while migrations are pending
+        """
+        path = os.path.join(tempfile.mkdtemp(), "test.db")
+        config["startup"] = type("startup", (Testing,), {"SQLALCHEMY_DATABASE_URI": "sqlite:///" + path})
+        self.addCleanup(config.pop, "startup")
+
+        app = create_app("startup")
+        self.assertEqual(stored_version(db.get_engine(app)), HEAD)
+        db.get_engine(app).dispose()
+
+        with mock.patch.object(db.Model.metadata, "create_all") as create_all:
+            app = create_app("startup")
+        create_all.assert_not_called()
+        db.get_engine(app).dispose()
+
+if __name__ == "__main__":
+    unittest.main()
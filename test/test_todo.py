@@ -1,4 +1,8 @@
+import json
 import unittest
+from api import db
+from api.models import ToDo, User
+from api.pagination import encode_cursor
 from test.basic import Base
 
 class TestTodo(Base):
@@ -14,6 +18,31 @@ class TestTodo(Base):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json["message"], "New todo created!")
 
+    def test_create_todos_batch(self):
+        """
+        test creating several todos with one request
+        """
+        token = super().get_access_token()[1]
+        header = {"Content-Type": "application/json", "x-access-token": token}
+        payload = json.dumps([{"item": "First todo"}, {"item": "Second todo"}, {"item": "Third todo"}])
+
+        response = self.client.post("/api/todo/batch", headers=header, data=payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["message"], "New todos created!")
+
+        listing = self.client.get("/api/todo", headers={"x-access-token": token}).json["todos"]
+        self.assertEqual(response.json["ids"], [todo["id"] for todo in listing])
+        self.assertEqual(["First todo", "Second todo", "Third todo"], [todo["item"] for todo in listing])
+
+        self.app.config["TODO_BATCH_MAX"] = 2
+        response = self.client.post("/api/todo/batch", headers=header, data=payload)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json["message"], "Too many todos in one batch!")
+
+        response = self.client.post("/api/todo/batch", headers=header, data=json.dumps({"item": "Not a list"}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json["message"], "Expected a list of todos!")
+
     def test_get_todos(self): 
         """
         test route for getting all todos
@@ -30,6 +59,178 @@ class TestTodo(Base):
         self.assertEqual(len(response.json["todos"]), 2)
         self.assertEqual(response.json["todos"][1]["item"], "Get all todos")
 
+    def test_get_todos_paginated(self):
+        """
+        test keyset pagination of the todo listing
+        """
+        token = super().get_access_token()[1]
+        user_id = User.query.filter_by(name="user2").first().id
+        db.session.add_all([ToDo(item=f"todo {i}", user_id=user_id, complete=False) for i in range(5)])
+        db.session.commit()
+
+        response = self.client.get("/api/todo?limit=2", headers={"x-access-token": token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(["todo 0", "todo 1"], [todo["item"] for todo in response.json["todos"]])
+
+        items = []
+        cursor = response.json["next"]
+        while cursor:
+            response = self.client.get(f"/api/todo?limit=2&next={cursor}", headers={"x-access-token": token})
+            items += [todo["item"] for todo in response.json["todos"]]
+            cursor = response.json["next"]
+        self.assertEqual(["todo 2", "todo 3", "todo 4"], items)
+
+        response = self.client.get("/api/todo?next=not-a-cursor", headers={"x-access-token": token})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json["message"], "Invalid cursor!")
+
+        # ids beyond the range of a sqlite integer
+        cursor = encode_cursor(10 ** 30)
+        response = self.client.get(f"/api/todo?next={cursor}", headers={"x-access-token": token})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json["message"], "Invalid cursor!")
+
+        response = self.client.get("/api/todo?limit=0", headers={"x-access-token": token})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json["message"], "Invalid limit!")
+
+    def test_get_todos_not_modified(self):
+        """
+        test conditional requests of the todo listing
+        """
+        super().create_todo("Create a todo")
+        token = super().get_access_token()[1]
+
+        response = self.client.get("/api/todo", headers={"x-access-token": token})
+        etag = response.headers["ETag"]
+        self.assertTrue(etag.startswith("W/"))
+
+        response = self.client.get("/api/todo", headers={"x-access-token": token, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+
+        # another representation of the same todos
+        response = self.client.get("/api/todo/stats", headers={"x-access-token": token, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+        response = self.client.get("/api/todo?limit=1", headers={"x-access-token": token, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+        self.client.put("/api/todo/1", headers={"x-access-token": token})
+        response = self.client.get("/api/todo", headers={"x-access-token": token, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertTrue(response.json["todos"][0]["complete"] == 1)
+
+    def test_get_todos_cached(self):
+        """
+        test todo reads are cached and invalidated by changes
+        """
+        super().create_todo("Create a todo")
+        token, token2 = super().get_access_token()[:2]
+        header = {"x-access-token": token2}
+
+        self.client.get("/api/todo", headers=header)
+        self.client.get("/api/todo/1", headers=header)
+        self.client.get("/api/todo", headers=header)
+        self.client.get("/api/todo/1", headers=header)
+
+        response = self.client.get("/api/todo/cache", headers={"x-access-token": token})
+        self.assertEqual(response.json, {"hits": 2, "misses": 2})
+
+        self.client.put("/api/todo/1", headers=header)
+        response = self.client.get("/api/todo/1", headers=header)
+        self.assertTrue(response.json["todo"][0]["complete"] == 1)
+        response = self.client.get("/api/todo", headers=header)
+        self.assertTrue(response.json["todos"][0]["complete"] == 1)
+
+        response = self.client.get("/api/todo/cache", headers=header)
+        self.assertEqual(response.json["message"], "You don't have permission to perform that function!")
+
+    def test_search_todos(self):
+        """
+        test full text search of the todos of a user
+        """
+        token, token2 = super().get_access_token()[:2]
+        header = {"Content-Type": "application/json", "x-access-token": token2}
+        self.client.post("/api/todo/batch", headers={"Content-Type": "application/json", "x-access-token": token},
+            data=json.dumps([{"item": "buy milk"}]))
+        self.client.post("/api/todo/batch", headers=header, data=json.dumps([
+            {"item": "buy milk"}, {"item": "buy bread and milk"}, {"item": "milk, more milk"},
+            {"item": "walk the dog"}]))
+
+        response = self.client.get("/api/todo/search?q=milk", headers=header)
+        self.assertEqual(response.status_code, 200)
+        items = [todo["item"] for todo in response.json["todos"]]
+        self.assertEqual(3, len(items))
+        self.assertEqual("milk, more milk", items[0])
+
+        response = self.client.get("/api/todo/search?q=bu*%20milk", headers=header)
+        self.assertEqual({"buy milk", "buy bread and milk"}, {todo["item"] for todo in response.json["todos"]})
+
+        # keyset pagination follows the ranking
+        pages, cursor = [], ""
+        while True:
+            response = self.client.get(f"/api/todo/search?q=milk&limit=1&next={cursor}", headers=header)
+            pages += [todo["item"] for todo in response.json["todos"]]
+            cursor = response.json["next"]
+            if not cursor:
+                break
+        self.assertEqual(items, pages)
+
+        self.client.delete("/api/todo/batch", headers=header, data=json.dumps({"filter": "all"}))
+        response = self.client.get("/api/todo/search?q=milk", headers=header)
+        self.assertEqual([], response.json["todos"])
+
+        response = self.client.get("/api/todo/search?q=milk", headers={"x-access-token": token})
+        self.assertEqual(["buy milk"], [todo["item"] for todo in response.json["todos"]])
+
+        for keyset in ([10 ** 30, 1], [-1.5, 10 ** 30], [-1.5, -1]):
+            response = self.client.get(f"/api/todo/search?q=milk&next={encode_cursor(keyset)}", headers=header)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json["message"], "Invalid cursor!")
+
+        # a todo id beyond 32 bits lands in the index rowid range of the next user,
+        # the low bits matching the id of another todo
+        owner = User.query.filter_by(name="user1").first()
+        mine = ToDo.query.filter_by(user_id=owner.id).first()
+        db.session.add(ToDo(id=(1 << 32) + mine.id, item="more milk", complete=False, user_id=owner.id))
+        db.session.commit()
+        response = self.client.get("/api/todo/search?q=milk", headers=header)
+        self.assertEqual([], response.json["todos"])
+
+        response = self.client.get("/api/todo/search?q=%22%2A", headers=header)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json["message"], "Invalid search query!")
+
+    def test_filter_and_stats(self):
+        """
+        test listing completed or open todos and counting them
+        """
+        token = super().get_access_token()[1]
+        header = {"Content-Type": "application/json", "x-access-token": token}
+        ids = self.client.post("/api/todo/batch", headers=header,
+            data=json.dumps([{"item": "First"}, {"item": "Second"}, {"item": "Third"}])).json["ids"]
+        self.client.put(f"/api/todo/{ids[1]}", headers=header)
+
+        response = self.client.get("/api/todo?complete=true", headers=header)
+        self.assertEqual(["Second"], [todo["item"] for todo in response.json["todos"]])
+        response = self.client.get("/api/todo?complete=false", headers=header)
+        self.assertEqual(["First", "Third"], [todo["item"] for todo in response.json["todos"]])
+
+        response = self.client.get("/api/todo?complete=maybe", headers=header)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json["message"], "Invalid filter!")
+
+        response = self.client.get("/api/todo/stats", headers=header)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {"total": 3, "completed": 1, "open": 2})
+
+        self.client.delete(f"/api/todo/{ids[0]}", headers=header)
+        response = self.client.get("/api/todo/stats", headers=header)
+        self.assertEqual(response.json, {"total": 2, "completed": 1, "open": 1})
+
     def test_get_todo(self):
         """
         test route for getting a todo
@@ -69,6 +270,38 @@ class TestTodo(Base):
         self.assertEqual(response.status_code, 200)
         self.assertFalse(response.json["todo"][0]["complete"] == 1)
 
+    def test_bulk_complete_and_delete(self):
+        """
+        test completing and deleting todos selected by ids or by a filter
+        """
+        token, token2 = super().get_access_token()[:2]
+        header = {"Content-Type": "application/json", "x-access-token": token2}
+        self.client.post("/api/todo/batch", headers={"Content-Type": "application/json", "x-access-token": token},
+            data=json.dumps([{"item": "Not mine"}]))
+        ids = self.client.post("/api/todo/batch", headers=header,
+            data=json.dumps([{"item": "First"}, {"item": "Second"}, {"item": "Third"}])).json["ids"]
+
+        # the todo of the other user is not counted
+        response = self.client.put("/api/todo/batch", headers=header, data=json.dumps({"ids": [1] + ids[:2]}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["count"], 2)
+        self.assertEqual(response.json["message"], "Todo items have been updated as complete!")
+
+        response = self.client.delete("/api/todo/batch", headers=header, data=json.dumps({"filter": "completed"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["count"], 2)
+        self.assertEqual(response.json["message"], "Todo items deleted!")
+
+        listing = self.client.get("/api/todo", headers=header).json["todos"]
+        self.assertEqual(["Third"], [todo["item"] for todo in listing])
+
+        response = self.client.get("/api/todo/1", headers={"x-access-token": token})
+        self.assertFalse(response.json["todo"][0]["complete"] == 1)
+
+        response = self.client.delete("/api/todo/batch", headers=header, data=json.dumps({"filter": "unknown"}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json["message"], "Expected a list of ids or a filter!")
+
     def test_delete_todo(self):        
         """
         test delete todo route
@@ -86,6 +319,14 @@ class TestTodo(Base):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json["message"], "Todo does not exist!")
 
+        # sqlite would match todo 1 to these ids
+        for todo_id in ("1.0", "01e0", "\u00b9"):
+            for method in (self.client.get, self.client.put, self.client.delete):
+                response = method(f"/api/todo/{todo_id}", headers={"x-access-token": token})
+                self.assertEqual(response.json["message"], "Todo does not exist!")
+        self.assertEqual(ToDo.query.count(), 1)
+        self.assertFalse(ToDo.query.get(1).complete)
+
     def test_inaccessible_todo(self): 
         """
         test routes for non-existing todos
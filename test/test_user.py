@@ -1,5 +1,6 @@
 import json
 import unittest
+from api.models import ToDo
 from test.basic import Base
 
 class TestUser(Base):
@@ -17,7 +18,44 @@ class TestUser(Base):
         self.assertEqual(2, len(response.json["users"]))
         self.assertEqual("user1", response.json["users"][0]["name"])
         self.assertEqual(str, type(response.json["users"][0]["public_id"]))
+        self.assertIsNone(response.json["next"])
+
+    def test_get_users_paginated(self):
+        """
+        test keyset pagination of the user listing
+        """
+        token = super().get_access_token()[0]
+        response = self.client.get("/api/user?limit=1", headers = {"x-access-token": token})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(["user1"], [user["name"] for user in response.json["users"]])
+
+        response = self.client.get(f"/api/user?limit=1&next={response.json['next']}",
+            headers = {"x-access-token": token})
+
+        self.assertEqual(["user2"], [user["name"] for user in response.json["users"]])
+        self.assertIsNone(response.json["next"])
         
+    def test_get_users_not_modified(self):
+        """
+        test conditional requests of the user listing
+        """
+        token, token2, _, pub_id2 = super().get_access_token()
+
+        etag = self.client.get("/api/user", headers = {"x-access-token": token}).headers["ETag"]
+        response = self.client.get("/api/user", headers = {"x-access-token": token, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        # non-admins never get an etag
+        response = self.client.get("/api/user", headers = {"x-access-token": token2, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response.headers)
+
+        self.client.put(f"/api/user/{pub_id2}/promote", headers = {"x-access-token": token})
+        response = self.client.get("/api/user", headers = {"x-access-token": token, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json["users"][1]["admin"] == True)
+
     def test_get_user(self):
         """
         test get a user route with admin
@@ -117,6 +155,42 @@ class TestUser(Base):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json["message"], "User does not exist!")
     
+    def test_cached_token_invalidated(self):
+        """
+        test cached tokens pick up promotion and deletion of their user
+        """
+        token, token2, _, pub_id2 = super().get_access_token()
+
+        response = self.client.get("/api/user", headers = {"x-access-token": token2})
+        self.assertEqual(response.json["message"], "You don't have permission to perform that function!")
+        self.assertIsNotNone(self.app.extensions["token_cache"].get(token2))
+
+        self.client.put(f"/api/user/{pub_id2}/promote", headers = {"x-access-token": token})
+        self.assertIsNone(self.app.extensions["token_cache"].get(token2))
+
+        response = self.client.get("/api/user", headers = {"x-access-token": token2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(2, len(response.json["users"]))
+
+        self.client.delete(f"/api/user/{pub_id2}", headers = {"x-access-token": token})
+        response = self.client.get("/api/todo", headers = {"x-access-token": token2})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json["message"], "Invalid Token!")
+
+    def test_delete_user_with_todos(self):
+        """
+        test deleting a user also deletes the user's todos
+        """
+        super().create_todo("First todo")
+        super().create_todo("Second todo")
+        token, _, _, pub_id2 = super().get_access_token()
+        self.assertEqual(2, ToDo.query.count())
+
+        response = self.client.delete(f"/api/user/{pub_id2}", headers = {"x-access-token": token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["message"], "User has been deleted!")
+        self.assertEqual(0, ToDo.query.count())
+
     def test_inaccessible_user(self):
             """
             test routes for non exisiting user 
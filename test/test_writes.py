@@ -0,0 +1,71 @@
+import unittest
+from threading import Thread
+from sqlalchemy.exc import IntegrityError
+from api import db
+from api.models import ToDo, User
+from api.todo import add_todo
+from api.writes import WriteQueue
+from test.basic import Base
+
+class TestWrites(Base):
+    """
+    test the group commit of todo writes
+    """
+    def setUp(self):
+        """
+        coalesce the writes of the test app
+        """
+        super().setUp()
+        self.queue = self.app.extensions["write_queue"] = WriteQueue(self.app, db, True, 0.05, 100)
+
+    def test_coalesced_endpoints(self):
+        """
+        test the todo endpoints answer as before with coalescing enabled
+        """
+        token = self.get_access_token()[1]
+        header = {"x-access-token": token}
+
+        response = self.client.post("/api/todo", headers=header, json={"item": "milk"})
+        self.assertEqual(response.json["message"], "New todo created!")
+        response = self.client.put("/api/todo/1", headers=header)
+        self.assertEqual(response.json["message"], "Todo item has been updated as complete!")
+        response = self.client.put("/api/todo/2", headers=header)
+        self.assertEqual(response.json["message"], "Todo does not exist!")
+
+        response = self.client.get("/api/todo", headers=header)
+        self.assertEqual(response.json["todos"], [{"id": 1, "item": "milk", "complete": True}])
+
+    def test_batch_results(self):
+        """
+        test concurrent writes share a commit while a failing write only fails its own request
+        """
+        self.sign_up("user1", "password")
+        user_id = User.query.filter_by(name="user1").first().id
+        results = {}
+
+        def submit(n):
+            with self.app.app_context():
+                try:
+                    # a todo without an item violates NOT NULL
+                    results[n] = self.queue.submit(add_todo, user_id, None if n == 3 else f"todo {n}")
+                except Exception as e:
+                    results[n] = e
+
+        threads = [Thread(target=submit, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIsInstance(results.pop(3), IntegrityError)
+        self.assertEqual(list(results.values()), [None] * 7)
+        self.assertEqual(ToDo.query.filter_by(user_id=user_id).count(), 7)
+
+        samples = {name: value for name, _, value in self.queue.batch_size.samples()}
+        self.assertEqual(samples["write_batch_size_sum"], 8)
+        self.assertLess(samples["write_batch_size_count"], 8)
+        self.assertEqual(dict((name, value) for name, _, value in self.queue.queue_wait.samples())
+                         ["write_queue_wait_seconds_count"], 8)
+
+if __name__ == "__main__":
+    unittest.main()